@@ -0,0 +1,236 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ConnectDB  # Созданный модуль
+import HttpClient  # Созданный модуль
+import ParserCodeforces  # Созданный модуль
+import Snapshot  # Созданный модуль
+
+
+CORPUS_DIR = os.getenv('BENCHMARK_CORPUS', 'benchmark_corpus')
+OUTPUT_FILE = 'benchmark_results.jsonl'
+SNAPSHOT_PAGE_SIZE = 100  # Количество задач снимка в одном пакете записи, как на странице сайта
+SCHEMA = os.getenv('BENCHMARK_SCHEMA', 'benchmark')  # Схема БД для замера записи, рабочие таблицы не затрагиваются
+
+
+def record_corpus(directory: str, pages: int) -> None:
+    """
+    Запись страниц задач с сайта в каталог корпуса, чтобы дальше замеры шли без сети
+    :param directory: каталог корпуса
+    :param pages: количество страниц
+    :return: None
+    """
+    os.makedirs(directory, exist_ok=True)
+    for num in range(1, pages + 1):
+        url = ParserCodeforces.URL if num == 1 else ParserCodeforces.PAGE_URL.format(num)
+        with open(os.path.join(directory, f'page_{num:03}.html'), 'wb') as f:
+            f.write(ParserCodeforces.fetch_page(url))
+    print(f'Recorded {pages} pages into {directory}')
+
+
+def load_corpus(directory: str) -> list:
+    """
+    Чтение корпуса страниц
+    :param directory: каталог с файлами *.html
+    :return: список тел страниц
+    """
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    if not pages:
+        raise SystemExit(f'No *.html pages in {directory}, record them with --record')
+    return pages
+
+
+def measure(name: str, func, pages: int, setup=None) -> dict:
+    """
+    Замер времени и пикового объёма памяти выполнения func.
+    Этап выполняется в отдельном процессе, порождённом fork, поэтому прирост максимального RSS процесса
+    относится только к этому этапу и учитывает память libxml2, которую не видит tracemalloc
+    :param name: имя этапа
+    :param func: функция без аргументов, возвращающая количество обработанных строк
+    :param pages: количество обработанных страниц
+    :param setup: функция без аргументов, выполняемая в процессе этапа до начала замера
+    :return: словарь с результатами этапа
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.get_context('fork').Process(target=_run_stage, args=(func, setup, sender), name=name)
+    process.start()
+    sender.close()
+    try:
+        outcome = receiver.recv()
+    except EOFError:
+        outcome = RuntimeError(f'stage {name} exited with code {process.exitcode}')
+    process.join()
+    if isinstance(outcome, Exception):
+        raise outcome
+    rows, elapsed, peak = outcome
+    result = {
+        'stage': name,
+        'pages': pages,
+        'rows': rows,
+        'seconds': round(elapsed, 4),
+        'pages_per_sec': round(pages / elapsed, 2) if elapsed else None,
+        'rows_per_sec': round(rows / elapsed, 2) if elapsed else None,
+        'peak_mem_mb': round(peak / 1024, 2),
+    }
+    print(f"{name:>8}: {result['pages_per_sec']} pages/s, {result['rows_per_sec']} rows/s, "
+          f"{result['peak_mem_mb']} MB peak")
+    return result
+
+
+def _run_stage(func, setup, conn) -> None:
+    """
+    Выполнение этапа в дочернем процессе. ru_maxrss сразу после fork равен RSS, унаследованному от родителя
+    :param func: функция этапа
+    :param setup: функция подготовки этапа или None
+    :param conn: конец канала для передачи (строки, секунды, прирост максимального RSS в КБ) или исключения
+    :return: None
+    """
+    try:
+        if setup is not None:
+            setup()
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        rows = func()
+        elapsed = time.perf_counter() - start
+        conn.send((rows, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before))
+    except Exception as e:
+        conn.send(e)
+    finally:
+        conn.close()
+
+
+def bench_parse(pages: list) -> int:
+    """
+    Разбор всех страниц корпуса в одном потоке
+    :param pages: тела страниц
+    :return: количество разобранных строк
+    """
+    return sum(len(ParserCodeforces.parse_html(html)) for html in pages)
+
+
+def bench_stream(pages: list, chunk_size: int) -> int:
+    """
+    Потоковый разбор всех страниц корпуса частями по chunk_size байт, как при загрузке с PARSER_STREAM=1
+    :param pages: тела страниц
+    :param chunk_size: размер части в байтах
+    :return: количество разобранных строк
+    """
+    rows = 0
+    for html in pages:
+        chunks = (html[i:i + chunk_size] for i in range(0, len(html), chunk_size))
+        rows += sum(1 for _ in ParserCodeforces.parse_stream(chunks))
+    return rows
+
+
+def bench_fetch(pages: list, latency: float, workers: int) -> int:
+    """
+    Имитация загрузки страниц пулом потоков, как в parse_site: каждая страница отдаётся с задержкой latency
+    :param pages: тела страниц
+    :param latency: задержка ответа сайта в секундах
+    :param workers: количество одновременно загружаемых страниц
+    :return: количество разобранных строк
+    """
+    def fetch(html: bytes) -> bytes:
+        time.sleep(latency)
+        return html
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(len(ParserCodeforces.parse_html(html)) for html in pool.map(fetch, pages))
+
+
+def prepare_ingest(schema: str) -> None:
+    """
+    Подготовка пустых таблиц в отдельной схеме БД, указанной переменными окружения DATABASE_*.
+    Таблицы очищаются перед каждым замером, поэтому задачи каждый раз действительно добавляются,
+    а не пропускаются как неизменившиеся, и рабочие таблицы не меняются
+    :param schema: имя схемы
+    :return: None
+    """
+    os.environ['DATABASE_SCHEMA'] = schema
+    database = ConnectDB.ConDB()
+    with database.transaction() as cur:
+        cur.execute(f"TRUNCATE {schema}.codeforces, {schema}.notice, {schema}.notice_query RESTART IDENTITY CASCADE;")
+    ConnectDB.TAGS.reset()
+
+
+def bench_ingest(problems: list) -> int:
+    """
+    Запись разобранных страниц в БД, подготовленную prepare_ingest
+    :param problems: списки объектов Problem по страницам
+    :return: количество записанных строк
+    """
+    database = ConnectDB.ConDB()
+    for page in problems:
+        ConnectDB.update_database_codeforces_bulk(database, page)
+    return sum(len(page) for page in problems)
+
+
+def git_revision() -> str:
+    """
+    :return: хеш текущего коммита или None вне git
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the Codeforces parser')
+    parser.add_argument('--corpus', default=CORPUS_DIR, help='directory with recorded problemset pages')
+    parser.add_argument('--record', type=int, metavar='PAGES', help='record PAGES pages from the site and exit')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated response time per page, s')
+    parser.add_argument('--workers', type=int, default=ParserCodeforces.MAX_WORKERS)
+    parser.add_argument('--db', action='store_true', help='also benchmark ingestion into PostgreSQL')
+    parser.add_argument('--schema', default=SCHEMA, help='database schema emptied and filled by the ingest stage')
+    parser.add_argument('--snapshot', help='ingest the problems of a Snapshot.py export instead of the corpus')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='JSON lines file the results are appended to')
+    args = parser.parse_args()
+
+    if args.record:
+        record_corpus(args.corpus, args.record)
+        return
+
+    pages = load_corpus(args.corpus)
+    stages = [
+        measure('parse', lambda: bench_parse(pages), len(pages)),
+        measure('stream', lambda: bench_stream(pages, HttpClient.CHUNK_SIZE), len(pages)),
+        measure('fetch', lambda: bench_fetch(pages, args.latency, args.workers), len(pages)),
+    ]
+    if args.db:
+        if args.snapshot:
+            loaded = Snapshot.load_problems(args.snapshot)
+            problems = [loaded[i:i + SNAPSHOT_PAGE_SIZE] for i in range(0, len(loaded), SNAPSHOT_PAGE_SIZE)]
+        else:
+            problems = [[ConnectDB.Problem(*row) for row in ParserCodeforces.parse_html(html)] for html in pages]
+        stages.append(measure('ingest', lambda: bench_ingest(problems), len(problems),
+                              setup=lambda: prepare_ingest(args.schema)))
+
+    run = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'latency': args.latency,
+        'workers': args.workers,
+        'snapshot': args.snapshot,
+        'max_rss_mb': round(max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024, 2),
+        'stages': stages,
+    }
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run) + '\n')
+    print(f"Max RSS {run['max_rss_mb']} MB, results appended to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
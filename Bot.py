@@ -3,13 +3,22 @@ from aiogram.dispatcher import Dispatcher, FSMContext
 from aiogram.utils import executor
 from aiogram.dispatcher.filters import Text, state
 from aiogram.utils.exceptions import MessageNotModified
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiohttp import web
 
+import Catalog  # Созданный модуль кеша сложностей и категорий
 import ConnectDB  # Созданный модуль для работы с PostgreSQL
+import FsmStorage  # Созданный модуль хранилищ состояний FSM
+import Keyboards  # Созданный модуль кеша инлайн клавиатур
+import ResultCache  # Созданный модуль кеша результатов поиска
+import Metrics  # Созданный модуль метрик
+import asyncio
+import multiprocessing
 import os
 import logging
-import math
 import sys
+import time
 
 
 logging.basicConfig(filename='bot.log', level=logging.INFO, format='[%(asctime)s: %(levelname)s] %(message)s')
@@ -20,11 +29,58 @@ if not bot_token:
     logging.critical('bot::not token not available')
     sys.exit('bot token not available')
 
-storage = MemoryStorage()
+storage = FsmStorage.create_storage()
 bot = Bot(token=bot_token)
 dp = Dispatcher(bot, storage=storage)
 
-USER_DATA = {}  # Контейнер для поиска сета задач
+METRICS = Metrics.REGISTRY
+METRICS_FILE = os.getenv('BOT_METRICS_FILE', 'bot_metrics.json')  # Файл, в который периодически сохраняются метрики
+METRICS_FLUSH_INTERVAL = 60  # Период сохранения метрик в файл, с
+METRICS_PORT = os.getenv('BOT_METRICS_PORT')  # Порт HTTP-эндпоинта /metrics, без значения эндпоинт не запускается
+WEBHOOK_URL = os.getenv('BOT_WEBHOOK_URL')  # Внешний адрес бота, без значения бот работает через polling
+WEBHOOK_PATH = os.getenv('BOT_WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('BOT_WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('BOT_WEBHOOK_PORT', 8080))
+WEBHOOK_WORKERS = int(os.getenv('BOT_WEBHOOK_WORKERS', os.cpu_count() or 1))  # Количество процессов бота
+WORKER = 0  # Номер процесса бота в режиме webhook
+
+SEARCH_LIMIT = 30  # Максимальное количество задач в результате поиска по названию
+TASK_LIMIT = 20  # Количество задач в результате поиска без названия, начиная с которого выводится подсказка
+TRENDING_LIMIT = 10  # Количество задач в подборке популярных за сутки
+CATALOG = Catalog.Catalog()  # Сложности и категории задач для построения меню без обращения к БД
+KEYBOARDS = Keyboards.KeyboardCache(CATALOG)  # Готовые клавиатуры выбора набора задач
+SEARCH_CACHE = ResultCache.ResultCache(CATALOG, 'search')  # Результаты поиска задач по одинаковым параметрам
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Замер времени обработки сообщений и обратных запросов по хендлерам
+    """
+    async def on_process_message(self, message: types.Message, data: dict):
+        self._start(data)
+
+    async def on_post_process_message(self, message: types.Message, results: list, data: dict):
+        self._observe(data)
+
+    async def on_process_callback_query(self, callback: types.CallbackQuery, data: dict):
+        self._start(data)
+
+    async def on_post_process_callback_query(self, callback: types.CallbackQuery, results: list, data: dict):
+        self._observe(data)
+
+    @staticmethod
+    def _start(data: dict):
+        data['metrics_handler'] = current_handler.get().__name__
+        data['metrics_start'] = time.perf_counter()
+
+    @staticmethod
+    def _observe(data: dict):
+        if 'metrics_start' in data:
+            METRICS.observe('bot_handler_seconds', time.perf_counter() - data['metrics_start'],
+                            handler=data['metrics_handler'])
+
+
+dp.middleware.setup(MetricsMiddleware())
 
 
 class FormSingleSearch(state.StatesGroup):
@@ -41,10 +97,11 @@ async def cmd_start(message: types.Message):
     :param message: Объект сообщения
     :return:
     """
-    USER_DATA.clear()
+    await dp.current_state().update_data(set_rank=None, set_notice=None)
     start_keyboard = types.ReplyKeyboardMarkup(
         keyboard=[
-            [types.KeyboardButton(text='Выбрать набор задач'), types.KeyboardButton(text='Искать задачу')]
+            [types.KeyboardButton(text='Выбрать набор задач'), types.KeyboardButton(text='Искать задачу')],
+            [types.KeyboardButton(text='Популярные задачи')],
         ],
         resize_keyboard=True,
         one_time_keyboard=True,
@@ -203,29 +260,29 @@ async def _single_not_have_name_in_data(message: types.Message, state: FSMContex
     :param data: Словарь с данными
     :return:
     """
-    db = ConnectDB.ConDB()
+    db = ConnectDB.AsyncConDB()
+    key = _search_key(data)
     if 'rank' not in data:
         query = """
         SELECT name, rank, link
-        FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-        INNER JOIN notice USING(id_notice)
-        WHERE notice_name=%s
+        FROM problem_facet
+        WHERE lower(notice_title)=lower(%s) OR lower(notice_name)=lower(%s)
+        LIMIT %s
         """
-        vars = (data['notice'],)
-        task_list = db.select(query, vars)
+        vars = (data['notice'], data['notice'])
+        task_list = await _search_select(db, 'search_by_notice', ('tasks', *key), query, (*vars, TASK_LIMIT))
         if len(task_list) == 0:
             await _single_not_found(message, state)
-        elif len(task_list) < 20:
+        elif len(task_list) < TASK_LIMIT:
             await _single_print_keyboard(message, state, task_list)
         else:
             query = """
             SELECT rank
-            FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-            INNER JOIN notice USING(id_notice)
-            WHERE notice_name=%s
-            GROUP BY rank
+            FROM facet_count
+            WHERE lower(notice_title)=lower(%s) OR lower(notice_name)=lower(%s)
             """
-            rank_list = sorted(str(i[0]) for i in db.select(query, vars) if i[0])
+            rows = await _search_select(db, 'search_notice_ranks', ('ranks', key[2]), query, vars)
+            rank_list = sorted(str(i[0]) for i in rows if i[0])
             text = f"Результат слишком большой 😓\nУкажите дополнительные параметры поиска!\n" \
                    f"Список доступных сложностей в данной категории в помощь 😇\n{', '.join(rank_list)}"
             await message.answer(text)
@@ -233,25 +290,24 @@ async def _single_not_have_name_in_data(message: types.Message, state: FSMContex
     elif 'notice' not in data:
         query = """
         SELECT name, rank, link
-        FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-        INNER JOIN notice USING(id_notice)
+        FROM codeforces
         WHERE rank=%s
+        LIMIT %s
         """
         vars = (data['rank'],)
-        task_list = db.select(query, vars)
+        task_list = await _search_select(db, 'search_by_rank', ('tasks', *key), query, (*vars, TASK_LIMIT))
         if len(task_list) == 0:
             await _single_not_found(message, state)
-        elif len(task_list) < 20:
+        elif len(task_list) < TASK_LIMIT:
             await _single_print_keyboard(message, state, task_list)
         else:
             query = """
-            SELECT notice_name
-            FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-            INNER JOIN notice USING(id_notice)
+            SELECT notice_title
+            FROM facet_count
             WHERE rank=%s
-            GROUP BY notice_name
             """
-            rank_list = sorted(i[0] for i in db.select(query, vars) if i[0])
+            rows = await _search_select(db, 'search_rank_notices', ('notices', key[1]), query, vars)
+            rank_list = sorted(i[0] for i in rows if i[0])
             text = f"Результат слишком большой 😓\nУкажите дополнительные параметры поиска!\n" \
                    f"Список доступных категорий при заданной сложности в помощь 😇\n{', '.join(rank_list)}"
             await message.answer(text)
@@ -259,12 +315,13 @@ async def _single_not_have_name_in_data(message: types.Message, state: FSMContex
     else:
         query = """
         SELECT name, rank, link
-        FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-        INNER JOIN notice USING(id_notice)
-        WHERE notice_name=%s AND rank=%s
+        FROM problem_facet
+        WHERE (lower(notice_title)=lower(%s) OR lower(notice_name)=lower(%s)) AND rank=%s
+        ORDER BY count_solve DESC NULLS LAST
+        LIMIT %s
         """
-        vars = (data['notice'], data['rank'])
-        task_list = db.select(query, vars)
+        vars = (data['notice'], data['notice'], data['rank'], SEARCH_LIMIT)
+        task_list = await _search_select(db, 'search_by_rank_notice', ('tasks', *key), query, vars)
         if len(task_list) == 0:
             await _single_not_found(message, state)
         else:
@@ -280,49 +337,78 @@ async def _single_have_name_in_data(message: types.Message, state: FSMContext, d
     :param data: Словарь с данными
     :return:
     """
-    db = ConnectDB.ConDB()
-    name = data['name']
+    db = ConnectDB.AsyncConDB()
+    name = _like_pattern(data['name'])
+    has_notice = """
+    EXISTS (SELECT 1 FROM problem_facet
+    WHERE problem_facet.id_codeforces=codeforces.id_codeforces AND (notice_title ILIKE %s OR notice_name ILIKE %s))
+    """
     if 'rank' not in data and 'notice' not in data:
-        query = """
-        SELECT name, rank, link
-        FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-        INNER JOIN notice USING(id_notice)
-        WHERE name LIKE %s
-        GROUP BY name, rank, link
-        """
-        vars = ('%' + name + '%',)
+        where = "name ILIKE %s"
+        vars = (name,)
     elif 'rank' not in data:
-        query = """
-        SELECT name, rank, link
-        FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-        INNER JOIN notice USING(id_notice)
-        WHERE name LIKE %s AND notice_name LIKE %s
-        """
-        vars = ('%' + name + '%', '%' + data['notice'] + '%')
+        where = f"name ILIKE %s AND {has_notice}"
+        vars = (name, _like_pattern(data['notice']), _like_pattern(data['notice']))
     elif 'notice' not in data:
-        query = """
-        SELECT name, rank, link
-        FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-        INNER JOIN notice USING(id_notice)
-        WHERE name LIKE %s AND rank=%s
-        GROUP BY name, rank, link
-        """
-        vars = ('%' + name + '%', data['rank'])
+        where = "name ILIKE %s AND rank=%s"
+        vars = (name, data['rank'])
     else:
-        query = """
-        SELECT name, rank, link
-        FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-        INNER JOIN notice USING(id_notice)
-        WHERE name LIKE %s AND notice_name LIKE %s AND rank=%s
-        """
-        vars = ('%' + name + '%', '%' + data['notice'] + '%', data['rank'])
-    task_list = db.select(query, vars)
+        where = f"name ILIKE %s AND rank=%s AND {has_notice}"
+        vars = (name, data['rank'], _like_pattern(data['notice']), _like_pattern(data['notice']))
+    # Поиск по name ILIKE использует триграммный индекс, лучшие совпадения выводятся первыми
+    query = f"""
+    SELECT name, rank, link
+    FROM codeforces
+    WHERE {where}
+    ORDER BY similarity(name, %s) DESC, count_solve DESC NULLS LAST
+    LIMIT %s
+    """
+    vars = (*vars, data['name'], SEARCH_LIMIT)
+    task_list = await _search_select(db, 'search_by_name', ('tasks', *_search_key(data)), query, vars)
     if len(task_list) == 0:
         await _single_not_found(message, state)
     else:
         await _single_print_keyboard(message, state, task_list)
 
 
+def _search_key(data: dict) -> tuple:
+    """
+    Нормализация параметров поиска для ключа SEARCH_CACHE: регистр не влияет ни на ILIKE, ни на сравнение
+    категорий через lower, а пробелы по краям названия отбрасывает _like_pattern
+    :param data: Словарь с данными поиска
+    :return: кортеж (название, сложность, категория), отсутствующие параметры равны None
+    """
+    name, rank, notice = data.get('name'), data.get('rank'), data.get('notice')
+    return (
+        name.strip().lower() if name is not None else None,
+        rank.strip() if rank is not None else None,
+        notice.lower() if notice is not None else None,
+    )
+
+
+async def _search_select(db: ConnectDB.AsyncConDB, name: str, key: tuple, query: str, vars: tuple) -> list:
+    """
+    Выборка через кеш результатов поиска
+    :param db: Объект работающий с PostgreSQL
+    :param name: метка запроса в метриках db_query_seconds
+    :param key: ключ результата в SEARCH_CACHE
+    :param query: PostgreSQL запрос
+    :param vars: Последовательность атрибутов для формирования запроса
+    :return: список данных
+    """
+    return await SEARCH_CACHE.get(key, lambda: db.select(query, vars, name=name))
+
+
+def _like_pattern(value: str) -> str:
+    """
+    Формирование шаблона ILIKE для поиска подстроки, спецсимволы шаблона во введённом тексте экранируются
+    :param value: Текст, введённый пользователем
+    :return: Шаблон для ILIKE
+    """
+    value = value.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{value}%'
+
+
 async def _single_not_found(message: types.Message, state: FSMContext):
     """
     Вспомогательная функция для действий при остутствии результатов поиска
@@ -350,6 +436,33 @@ async def _single_print_keyboard(message: types.Message, state: FSMContext, mapp
     await message.answer(text, reply_markup=keyboard)
 
 
+@dp.message_handler(commands=['trending'])
+@dp.message_handler(Text(contains='Популярные задачи'))
+async def cmd_trending(message: types.Message):
+    """
+    Хендлер выводящий задачи с наибольшим приростом решений за сутки по сводке solve_trend
+    :param message: Объект сообщения
+    :return:
+    """
+    db = ConnectDB.AsyncConDB()
+    query = """
+    SELECT name, solved_day, link
+    FROM solve_trend INNER JOIN codeforces USING(id_codeforces)
+    WHERE solved_day > 0
+    ORDER BY solved_day DESC
+    LIMIT %s
+    """
+    vars = (TRENDING_LIMIT,)
+    tasks = await db.select(query, vars, name='trending')
+    if not tasks:
+        await message.answer('За последние сутки решений не прибавилось 😴')
+        return
+    keyboard = types.InlineKeyboardMarkup()
+    for name, solved_day, link in tasks:
+        keyboard.add(types.InlineKeyboardButton(f'{name} +{solved_day}', url=BASE_URL + link))
+    await message.answer('Больше всего решали за сутки 🔥', reply_markup=keyboard)
+
+
 @dp.message_handler(Text(contains='Выбрать набор задач'))
 async def cmd_get_set(message: types.Message):
     """
@@ -357,69 +470,60 @@ async def cmd_get_set(message: types.Message):
     :param message: Объект сообщения
     :return:
     """
-    db = ConnectDB.ConDB()
-
-    rank_keyboard = types.InlineKeyboardMarkup()
-    for i in _get_ranks(db):
-        rank_keyboard.add(types.InlineKeyboardButton(text=i, callback_data=f'set_rank_{i}'))
+    rank_keyboard = await KEYBOARDS.get(('ranks',), _build_rank_keyboard)
     await message.answer('Выберите необходимую сложность задачи', reply_markup=rank_keyboard)
 
 
 @dp.callback_query_handler(Text(startswith='set_'))
-async def callback_get_set(callback: types.CallbackQuery):
+async def callback_get_set(callback: types.CallbackQuery, state: FSMContext):
     """
     Хендлер организующий обмен информацией с пользователем для вывода нужного набора задач из БД
     :param callback: внутренний запрос с данными от пользователя
+    :param state: Объект для работы с машиной состояний, хранит выбранные сложность и категорию
     :return:
     """
     action = callback['data'].split('set_', 1)[1]
 
     if action.startswith('rank'):
-        await _get_set_rank(callback, action)
+        await _get_set_rank(callback, state, action)
     elif action.startswith('num_'):
-        await _get_set_num(callback, action)
+        await _get_set_num(callback, state, action)
     elif action.startswith('n'):
-        await _get_set_notice(callback, action)
+        await _get_set_notice(callback, state, action)
 
     await callback.answer()
 
 
-async def _get_set_rank(callback: types.callback_query, action: str) -> None:
+async def _get_set_rank(callback: types.callback_query, state: FSMContext, action: str) -> None:
     """
     Обработка сложности задачи из запроса и формирование клавиатуры с категориями задач
     :param callback: обратный запрос
+    :param state: Объект для работы с машиной состояний
     :param action: строка с сложностью задачи из запроса
     :return:
     """
-    db = ConnectDB.ConDB()
-
     rank = int(action.split('rank_', 1)[1])
-    USER_DATA['rank'] = rank
+    await state.update_data(set_rank=rank, set_notice=None)
 
-    notice_keyboard = types.InlineKeyboardMarkup()
-    for notice in _get_notices(db, rank):
-        notice_keyboard.add(types.InlineKeyboardButton(text=_validate_len_str(notice), callback_data=f'set_n_{notice}'))
+    notice_keyboard = await KEYBOARDS.get((rank,), lambda: _build_notice_keyboard(rank))
     await _update_markup(callback.message, 'Выберите необходимую категорию', notice_keyboard)
 
 
-async def _get_set_notice(callback: types.callback_query, action: str) -> None:
+async def _get_set_notice(callback: types.callback_query, state: FSMContext, action: str) -> None:
     """
-    Обработка категории задач и формирование клавиатуры с выбором сета задач
+    Обработка категории задач и формирование клавиатуры с выбором контеста.
+    В кнопку записывается id контеста, по которому его задачи выбираются из БД
     :param callback: обратный запрос
+    :param state: Объект для работы с машиной состояний
     :param action: запрос с категорией задач
     :return:
     """
-    db = ConnectDB.ConDB()
-
     notice = action.split('n_', 1)[1]
-    USER_DATA['notice'] = notice
-    if 'rank' in USER_DATA:
-        USER_DATA['data'] = _get_all_sets(db, USER_DATA['rank'], notice)
-
-        num_keyboard = types.InlineKeyboardMarkup()
-        count_set = math.ceil(len(USER_DATA['data']) / 10)
-        for i in range(1, count_set + 1):
-            num_keyboard.add(types.InlineKeyboardButton(text=f'Набор № {i}', callback_data=f'set_num_{i}'))
+    rank = (await state.get_data()).get('set_rank')
+    if rank is not None:
+        await state.update_data(set_notice=notice)
+
+        num_keyboard = await KEYBOARDS.get((rank, notice), lambda: _build_contests_keyboard(rank, notice))
         await _update_markup(callback.message, 'Выберите номер набора', num_keyboard)
     else:
         logging.error('Bot::_get_set_notice::отсутствует сложность задачи перед поиском категории задачи')
@@ -428,26 +532,19 @@ async def _get_set_notice(callback: types.callback_query, action: str) -> None:
         await cmd_start(callback.message)
 
 
-async def _get_set_num(callback: types.callback_query, action: str) -> None:
+async def _get_set_num(callback: types.callback_query, state: FSMContext, action: str) -> None:
     """
     Обработка вывода конкретного набора задач и вывод клавиатуры с списком этих задач
     :param callback: обратный запрос
-    :param action: запрос с номером сета задач
+    :param state: Объект для работы с машиной состояний
+    :param action: запрос с номером сета задач и id контеста
     :return:
     """
-    if 'rank' in USER_DATA and 'notice' in USER_DATA and 'data' in USER_DATA:
-        num = int(action.split('num_', 1)[1])
-
-        data = USER_DATA['data']
-        start_ind = (num - 1) * 10
-        end_ind = min(len(data), start_ind + 10)
-        result_set = data[start_ind: end_ind]
-
-        set_keyboard = types.InlineKeyboardMarkup()
-        for task in result_set:
-            name = task[0]
-            url = BASE_URL + task[1]
-            set_keyboard.add(types.InlineKeyboardButton(text=_validate_len_str(name), url=url))
+    data = await state.get_data()
+    if data.get('set_rank') is not None and data.get('set_notice') is not None:
+        num, id_contest = map(int, action.split('num_', 1)[1].split('_'))
+        key = (data['set_rank'], data['set_notice'], id_contest)
+        set_keyboard = await KEYBOARDS.get(key, lambda: _build_contest_keyboard(id_contest))
         await _update_markup(callback.message, f'Набор № {num}', set_keyboard)
     else:
         logging.error('Bot::_get_set_num::нарушен порядок заполнения данных для поиска в БД')
@@ -456,18 +553,16 @@ async def _get_set_num(callback: types.callback_query, action: str) -> None:
         await cmd_start(callback.message)
 
 
-async def _update_markup(message: types.Message, text: str, markup: types.InlineKeyboardMarkup) -> None:
+async def _update_markup(message: types.Message, text: str, markup: str) -> None:
     """
-    Вспомогательная функция для изменения инлайн клавиатуры
+    Вспомогательная функция для изменения текста и инлайн клавиатуры сообщения одним запросом к Telegram
     :param message: Сообщение, в котором будут происходить изменения
     :param text: Текст перед клавиатурой, на который будет произведена замена
-    :param markup: Новая клавиатура
+    :param markup: Новая клавиатура в JSON из KEYBOARDS
     :return:
     """
-    print(markup)
     try:
-        await message.edit_text(text)
-        await message.edit_reply_markup(reply_markup=markup)
+        await message.edit_text(text, reply_markup=markup)
     except MessageNotModified as e:
         logging.error(f'Bot::_update_markup::{e}')
         await message.delete()
@@ -475,55 +570,89 @@ async def _update_markup(message: types.Message, text: str, markup: types.Inline
         await cmd_start(message)
 
 
-def _get_ranks(db: ConnectDB.ConDB) -> list:
+async def _build_rank_keyboard() -> types.InlineKeyboardMarkup:
     """
-    Поиск в БД сложности задач
-    :param db: Объект работающий с PostgreSQL
-    :return: Отсортированный список возможных сложностей в задачах
+    Сборка клавиатуры выбора сложности
+    :return: Клавиатура
     """
-    query = """
-    SELECT rank
-    FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-    INNER JOIN notice USING(id_notice)
-    GROUP BY rank
+    keyboard = types.InlineKeyboardMarkup()
+    for i in CATALOG.ranks():
+        keyboard.add(types.InlineKeyboardButton(text=str(i), callback_data=f'set_rank_{i}'))
+    return keyboard
+
+
+async def _build_notice_keyboard(rank: int) -> types.InlineKeyboardMarkup:
     """
-    return sorted((i[0] for i in db.select(query) if i[0]))
+    Сборка клавиатуры выбора категории задач заданной сложности, в клавиатуру попадают только категории с контестами
+    :param rank: Сложность задачи
+    :return: Клавиатура
+    """
+    keyboard = types.InlineKeyboardMarkup()
+    for notice in CATALOG.notices(rank):
+        keyboard.add(types.InlineKeyboardButton(text=_validate_len_str(CATALOG.title(notice)),
+                                                callback_data=f'set_n_{notice}'))
+    return keyboard
 
 
-def _get_notices(db: ConnectDB.ConDB, rank: int) -> list:
+async def _build_contests_keyboard(rank: int, notice: str) -> types.InlineKeyboardMarkup:
     """
-    Поиск в БД категорий задач по их сложности
-    :param db: Объект работающий с PostgreSQL
+    Сборка клавиатуры выбора контеста заданной сложности и категории
     :param rank: Сложность задачи
-    :return: Отсортированный список из категорий задач
+    :param notice: Категория задачи
+    :return: Клавиатура
     """
-    query = """
-    SELECT notice_name
-    FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-    INNER JOIN notice USING(id_notice)
-    WHERE rank=%s
-    GROUP BY notice_name
+    keyboard = types.InlineKeyboardMarkup()
+    for num, id_contest in await _get_contests(ConnectDB.AsyncConDB(), rank, notice):
+        keyboard.add(types.InlineKeyboardButton(text=f'Набор № {num}', callback_data=f'set_num_{num}_{id_contest}'))
+    return keyboard
+
+
+async def _build_contest_keyboard(id_contest: int) -> types.InlineKeyboardMarkup:
+    """
+    Сборка клавиатуры со ссылками на задачи контеста
+    :param id_contest: id контеста
+    :return: Клавиатура
     """
-    vars = (rank,)
-    return sorted((i[0] for i in db.select(query, vars) if i[0]))
+    keyboard = types.InlineKeyboardMarkup()
+    for name, link in await _get_contest(ConnectDB.AsyncConDB(), id_contest):
+        keyboard.add(types.InlineKeyboardButton(text=_validate_len_str(name), url=BASE_URL + link))
+    return keyboard
 
 
-def _get_all_sets(db: ConnectDB.ConDB, rank: int, notice: str) -> list:
+async def _get_contests(db: ConnectDB.AsyncConDB, rank: int, notice: str) -> list:
     """
-    Осуществляет поиск в БД по сложности и категории задачи
+    Поиск контестов заданной сложности и категории
     :param db: Объект работающий с PostgreSQL
     :param rank: Сложность задачи
     :param notice: Категория задачи
-    :return: Список с именами и ссылками из искомых данных
+    :return: Список пар (номер контеста, id контеста) по возрастанию номера
     """
     query = """
-    SELECT name, link
-    FROM codeforces INNER JOIN notice_query USING(id_codeforces)
-    INNER JOIN notice USING(id_notice)
+    SELECT num, id_contest
+    FROM contest INNER JOIN notice USING(id_notice)
     WHERE rank=%s AND notice_name=%s
+    AND EXISTS (SELECT 1 FROM contest_problem WHERE contest_problem.id_contest=contest.id_contest)
+    ORDER BY num
     """
     vars = (rank, notice)
-    return db.select(query, vars)
+    return await db.select(query, vars, name='contests')
+
+
+async def _get_contest(db: ConnectDB.AsyncConDB, id_contest: int) -> list:
+    """
+    Выборка задач одного контеста
+    :param db: Объект работающий с PostgreSQL
+    :param id_contest: id контеста
+    :return: Список с именами и ссылками задач контеста
+    """
+    query = """
+    SELECT name, link
+    FROM contest_problem INNER JOIN codeforces USING(id_codeforces)
+    WHERE id_contest=%s
+    ORDER BY id_codeforces
+    """
+    vars = (id_contest,)
+    return await db.select(query, vars, name='contest')
 
 
 def _validate_len_str(value: str) -> str:
@@ -537,5 +666,101 @@ def _validate_len_str(value: str) -> str:
     return value
 
 
+async def on_startup(dispatcher: Dispatcher):
+    """
+    Создание пула соединений с БД и загрузка каталога до обработки первого сообщения.
+    В режиме webhook таблицы уже созданы в start_webhook_workers
+    :param dispatcher: Диспетчер бота
+    :return:
+    """
+    ConnectDB.AsyncConDB(create_tables=not WEBHOOK_URL)
+    await CATALOG.refresh(force=True)
+    asyncio.create_task(CATALOG.watch())
+    metrics_file = METRICS_FILE
+    if WORKER:
+        root, ext = os.path.splitext(METRICS_FILE)
+        metrics_file = f'{root}_{WORKER}{ext}'
+    asyncio.create_task(Metrics.flush_periodically(METRICS, metrics_file, METRICS_FLUSH_INTERVAL))
+    if METRICS_PORT:
+        await _start_metrics_server(int(METRICS_PORT) + WORKER)
+    if WEBHOOK_URL:
+        url = WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH
+        if (await dispatcher.bot.get_webhook_info()).url != url:
+            await dispatcher.bot.set_webhook(url)
+            logging.info(f'bot::Webhook set to {url}')
+
+
+async def _start_metrics_server(port: int) -> None:
+    """
+    Запуск HTTP-эндпоинта /metrics с метриками в текстовом формате Prometheus
+    :param port: порт эндпоинта
+    :return: None
+    """
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=METRICS.render(), content_type='text/plain')
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    logging.info(f'bot::Metrics endpoint started on port {port}')
+
+
+async def on_shutdown(dispatcher: Dispatcher):
+    """
+    Закрытие пула соединений с БД при остановке бота
+    :param dispatcher: Диспетчер бота
+    :return:
+    """
+    ConnectDB.AsyncConDB().close()
+
+
+def start_webhook_workers(workers: int = WEBHOOK_WORKERS) -> None:
+    """
+    Запуск бота в режиме webhook в нескольких процессах, которые слушают один порт (SO_REUSEPORT),
+    обновления между ними распределяет ядро. Состояния FSM должны храниться в общем хранилище,
+    с хранилищем в памяти запускается один процесс. Таблицы создаются один раз до запуска процессов,
+    кеши каталога и клавиатур каждого процесса сверяются с версией каталога в БД
+    :param workers: количество процессов
+    :return: None
+    """
+    if workers > 1 and isinstance(storage, FsmStorage.MemoryStorage):
+        logging.warning(f'bot::FSM state is kept in memory, starting 1 worker instead of {workers}. '
+                        f'Set BOT_FSM_STORAGE to postgres or redis for several workers')
+        workers = 1
+    ConnectDB.create_tables()
+    if workers <= 1:
+        _run_webhook(0)
+        return
+    processes = [multiprocessing.Process(target=_run_webhook, args=(worker,), name=f'bot-worker-{worker}')
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:  # Сигнал получают и процессы бота, дожидаемся их завершения
+        for process in processes:
+            process.join()
+
+
+def _run_webhook(worker: int) -> None:
+    """
+    Запуск одного процесса бота в режиме webhook
+    :param worker: номер процесса
+    :return: None
+    """
+    global WORKER
+    WORKER = worker
+    executor.start_webhook(
+        dp, WEBHOOK_PATH, on_startup=on_startup, on_shutdown=on_shutdown,
+        host=WEBHOOK_HOST, port=WEBHOOK_PORT, reuse_port=True,
+    )
+
+
 if __name__ == '__main__':
-    executor.start_polling(dp)
+    if WEBHOOK_URL:
+        start_webhook_workers()
+    else:
+        executor.start_polling(dp, on_startup=on_startup, on_shutdown=on_shutdown)
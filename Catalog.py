@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+
+import ConnectDB  # Созданный модуль
+
+
+CATALOG_TTL = float(os.getenv('BOT_CATALOG_TTL', 60))  # Период проверки версии каталога, с
+
+
+class Catalog:
+    """
+    Кеш сложностей и категорий задач в памяти процесса бота для меню выбора набора задач.
+    Категории хранятся по ключу из ссылки сайта, в меню показываются их названия на языке сайта.
+    В каталог попадают только пары (сложность, категория), у которых есть непустой контест.
+    Данные перечитываются из БД только при изменении версии каталога, которую увеличивает парсер после обхода
+    """
+    def __init__(self, ttl: float = CATALOG_TTL):
+        """
+        :param ttl: период проверки версии каталога в секундах
+        """
+        self.__ttl = ttl
+        self.__version = None
+        self.__notices = {}  # {сложность: список категорий, отсортированный по названию}
+        self.__titles = {}  # {категория: название на языке сайта}
+        self.__ranks = []
+
+    @property
+    def version(self):
+        return self.__version
+
+    def ranks(self) -> list:
+        """
+        :return: отсортированный список сложностей задач
+        """
+        return self.__ranks
+
+    def notices(self, rank: int) -> list:
+        """
+        :param rank: сложность задачи
+        :return: отсортированный список категорий задач данной сложности, по которым есть контесты
+        """
+        return self.__notices.get(rank, [])
+
+    def title(self, notice: str) -> str:
+        """
+        :param notice: категория задачи
+        :return: название категории для показа пользователю, ключ категории, если названия нет
+        """
+        return self.__titles.get(notice, notice)
+
+    async def refresh(self, force: bool = False) -> bool:
+        """
+        Проверка версии каталога и перечитывание данных из БД при её изменении
+        :param force: перечитать данные независимо от версии
+        :return: True, если данные были перечитаны
+        """
+        db = ConnectDB.AsyncConDB()
+        version = await ConnectDB.get_catalog_version(db)
+        if not force and version == self.__version:
+            return False
+
+        query = """
+        SELECT DISTINCT ct.rank, n.notice_name, COALESCE(n.title, n.notice_name)
+        FROM contest ct INNER JOIN notice n USING(id_notice)
+        WHERE EXISTS (SELECT 1 FROM contest_problem cp WHERE cp.id_contest=ct.id_contest)
+        """
+        rows = await db.select(query, name='catalog')
+        titles = {notice: title for rank, notice, title in rows}
+        notices = {}
+        for rank, notice, title in rows:
+            if not rank or not notice:
+                continue
+            notices.setdefault(rank, []).append(notice)
+        self.__titles = titles
+        self.__notices = {rank: sorted(names, key=lambda notice: titles[notice].lower())
+                          for rank, names in notices.items()}
+        self.__ranks = sorted(self.__notices)
+        self.__version = version
+        logging.info(f'Catalog::Loaded version {version}: {len(self.__ranks)} ranks, {len(rows)} pairs')
+        return True
+
+    async def watch(self) -> None:
+        """
+        Фоновая проверка версии каталога каждые ttl секунд, чтобы обработчики не обращались к БД
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.__ttl)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f'Catalog::watch::{e}')
@@ -0,0 +1,62 @@
+import json
+import os
+
+import requests
+
+import ConnectDB  # Созданный модуль
+import HttpClient  # Созданный модуль
+
+
+API_URL = os.getenv('CODEFORCES_API_URL', 'https://codeforces.com/api')  # Можно заменить локальным сервером
+PROBLEMS_URL = f'{API_URL}/problemset.problems?lang=ru'
+
+
+class ApiError(requests.RequestException):
+    """
+    API Codeforces вернуло ответ со статусом, отличным от OK, или ответ неожиданного формата
+    """
+
+
+def fetch_problems(client: HttpClient.HttpClient, url: str = PROBLEMS_URL):
+    """
+    Загрузка всех задач одним запросом к методу problemset.problems
+    :param client: HTTP-клиент парсера
+    :param url: адрес метода
+    :return: список объектов Problem в порядке ответа API (сначала новые).
+    Ответ разбирается целиком до возврата, поэтому ответ неожиданного формата приводит к ApiError здесь,
+    и полный обход переходит к HTML-страницам
+    """
+    try:
+        payload = json.loads(client.get(url))
+    except ValueError as e:
+        raise ApiError(f'problemset.problems: invalid JSON: {e}')
+    if payload.get('status') != 'OK':
+        raise ApiError(f"problemset.problems: {payload.get('comment', payload.get('status'))}")
+    try:
+        result = payload['result']
+        return list(iter_problems(result['problems'], result['problemStatistics']))
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ApiError(f'problemset.problems: unexpected payload: {e}')
+
+
+def iter_problems(problems: list, statistics: list):
+    """
+    Преобразование задач из ответа API в записи того же вида, что даёт разбор HTML-страниц
+    :param problems: список задач из ответа API
+    :param statistics: список количеств решений из ответа API
+    :return: генератор объектов Problem
+    """
+    solved = {(s.get('contestId'), s.get('index')): s.get('solvedCount') for s in statistics}
+    for problem in problems:
+        contest_id, index = problem.get('contestId'), problem.get('index')
+        if contest_id is None or not index or not problem.get('name'):
+            continue
+        yield ConnectDB.Problem(
+            f"{problem['name']} - {contest_id}{index}",
+            problem.get('rating'),
+            solved.get((contest_id, index)),
+            problem.get('tags', []),
+            f'/problemset/problem/{contest_id}/{index}',
+            contest_id,
+            index,
+        )
@@ -1,7 +1,160 @@
+import asyncio
+import hashlib
 import logging
 import psycopg2
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import NamedTuple
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from singleton_decorator import singleton
+import Metrics  # Созданный модуль
+
+
+PROBLEM_NUMBER = re.compile(r'(\d+)([A-Za-z][A-Za-z0-9]*)')  # Номер задачи: id контеста и индекс, например 1790F2
+POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', 5))  # Максимальное количество соединений в пуле бота
+QUERY_TIMEOUT = int(os.getenv('DATABASE_QUERY_TIMEOUT', 5000))  # Ограничение времени выполнения запроса бота, мс
+
+CREATE_TABLES_QUERY = """
+CREATE TABLE IF NOT EXISTS codeforces(
+id_codeforces SERIAL PRIMARY KEY, 
+name VARCHAR, 
+rank INTEGER, 
+count_solve INTEGER,
+link VARCHAR);
+CREATE TABLE IF NOT EXISTS notice(
+id_notice SERIAL PRIMARY KEY, 
+notice_name VARCHAR);
+CREATE TABLE IF NOT EXISTS notice_query(
+id_notice_query BIGSERIAL PRIMARY KEY,
+id_codeforces INTEGER NOT NULL REFERENCES codeforces, 
+id_notice INTEGER NOT NULL REFERENCES notice,
+UNIQUE (id_codeforces, id_notice));
+ALTER TABLE codeforces ADD COLUMN IF NOT EXISTS fingerprint VARCHAR;
+CREATE TABLE IF NOT EXISTS catalog_version(
+id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+version BIGINT NOT NULL);
+INSERT INTO catalog_version(id, version) VALUES (TRUE, 0) ON CONFLICT DO NOTHING;
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+CREATE INDEX IF NOT EXISTS codeforces_name_trgm_idx ON codeforces USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS codeforces_rank_idx ON codeforces(rank);
+CREATE UNIQUE INDEX IF NOT EXISTS notice_name_key ON notice(notice_name);
+ALTER TABLE notice ADD COLUMN IF NOT EXISTS title VARCHAR;
+ALTER TABLE codeforces ADD COLUMN IF NOT EXISTS contest_id INTEGER;
+ALTER TABLE codeforces ADD COLUMN IF NOT EXISTS problem_index VARCHAR;
+UPDATE codeforces SET
+contest_id=substring(name FROM ' - ([0-9]+)[A-Za-z][A-Za-z0-9]*$')::INTEGER,
+problem_index=substring(name FROM ' - [0-9]+([A-Za-z][A-Za-z0-9]*)$')
+WHERE contest_id IS NULL;
+INSERT INTO notice_query(id_codeforces, id_notice)
+SELECT MAX(d.id_codeforces), nq.id_notice
+FROM notice_query nq INNER JOIN codeforces c USING(id_codeforces)
+INNER JOIN codeforces d ON d.contest_id=c.contest_id AND d.problem_index=c.problem_index
+AND d.id_codeforces > c.id_codeforces
+GROUP BY c.id_codeforces, nq.id_notice
+ON CONFLICT DO NOTHING;
+DELETE FROM notice_query nq USING codeforces c, codeforces d
+WHERE nq.id_codeforces=c.id_codeforces AND d.contest_id=c.contest_id AND d.problem_index=c.problem_index
+AND d.id_codeforces > c.id_codeforces;
+DELETE FROM codeforces c USING codeforces d
+WHERE d.contest_id=c.contest_id AND d.problem_index=c.problem_index AND d.id_codeforces > c.id_codeforces;
+CREATE UNIQUE INDEX IF NOT EXISTS codeforces_problem_key ON codeforces(contest_id, problem_index);
+CREATE TABLE IF NOT EXISTS contest(
+id_contest SERIAL PRIMARY KEY,
+rank INTEGER NOT NULL,
+id_notice INTEGER NOT NULL REFERENCES notice,
+num INTEGER NOT NULL,
+UNIQUE (rank, id_notice, num));
+CREATE TABLE IF NOT EXISTS contest_problem(
+id_codeforces INTEGER PRIMARY KEY REFERENCES codeforces,
+id_contest INTEGER NOT NULL REFERENCES contest);
+CREATE INDEX IF NOT EXISTS contest_problem_contest_idx ON contest_problem(id_contest);
+CREATE TABLE IF NOT EXISTS crawl_checkpoint(
+crawl VARCHAR NOT NULL,
+page INTEGER NOT NULL,
+PRIMARY KEY (crawl, page));
+CREATE SEQUENCE IF NOT EXISTS crawl_run_seq;
+ALTER TABLE crawl_checkpoint ADD COLUMN IF NOT EXISTS run_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE crawl_checkpoint ADD COLUMN IF NOT EXISTS written_at TIMESTAMPTZ NOT NULL DEFAULT now();
+CREATE TABLE IF NOT EXISTS solve_history(
+id_codeforces INTEGER NOT NULL REFERENCES codeforces,
+crawl_ts TIMESTAMPTZ NOT NULL,
+count_solve INTEGER,
+rank INTEGER,
+PRIMARY KEY (id_codeforces, crawl_ts));
+CREATE INDEX IF NOT EXISTS solve_history_crawl_ts_idx ON solve_history USING BRIN (crawl_ts);
+INSERT INTO solve_history(id_codeforces, crawl_ts, count_solve, rank)
+SELECT id_codeforces, now(), count_solve, rank FROM codeforces
+WHERE NOT EXISTS (SELECT 1 FROM solve_history);
+CREATE TABLE IF NOT EXISTS solve_trend(
+id_codeforces INTEGER PRIMARY KEY REFERENCES codeforces,
+solved_day INTEGER NOT NULL,
+solved_week INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS solve_trend_day_idx ON solve_trend(solved_day DESC);
+DO $$ BEGIN
+IF to_regclass('problem_facet') IS NOT NULL AND NOT EXISTS (
+SELECT 1 FROM pg_attribute WHERE attrelid=to_regclass('problem_facet') AND attname='notice_title') THEN
+DROP MATERIALIZED VIEW IF EXISTS facet_count, problem_facet;
+END IF;
+END $$;
+CREATE MATERIALIZED VIEW IF NOT EXISTS problem_facet AS
+SELECT c.id_codeforces, n.id_notice, n.notice_name, COALESCE(n.title, n.notice_name) AS notice_title,
+c.rank, c.name, c.link, c.count_solve
+FROM codeforces c INNER JOIN notice_query nq USING(id_codeforces)
+INNER JOIN notice n USING(id_notice);
+CREATE UNIQUE INDEX IF NOT EXISTS problem_facet_key ON problem_facet(id_codeforces, id_notice);
+CREATE INDEX IF NOT EXISTS problem_facet_notice_rank_idx ON problem_facet(lower(notice_name), rank);
+CREATE INDEX IF NOT EXISTS problem_facet_title_rank_idx ON problem_facet(lower(notice_title), rank);
+CREATE INDEX IF NOT EXISTS problem_facet_rank_idx ON problem_facet(rank);
+CREATE INDEX IF NOT EXISTS problem_facet_notice_trgm_idx ON problem_facet USING GIN (notice_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS problem_facet_title_trgm_idx ON problem_facet USING GIN (notice_title gin_trgm_ops);
+CREATE MATERIALIZED VIEW IF NOT EXISTS facet_count AS
+SELECT rank, notice_name, notice_title, COUNT(*) AS count FROM problem_facet
+GROUP BY rank, notice_name, notice_title;
+CREATE UNIQUE INDEX IF NOT EXISTS facet_count_key ON facet_count(rank, notice_name);
+CREATE INDEX IF NOT EXISTS facet_count_notice_idx ON facet_count(lower(notice_name));
+CREATE INDEX IF NOT EXISTS facet_count_title_idx ON facet_count(lower(notice_title));
+ALTER TABLE codeforces ADD COLUMN IF NOT EXISTS time_limit REAL;
+ALTER TABLE codeforces ADD COLUMN IF NOT EXISTS memory_limit INTEGER;
+ALTER TABLE codeforces ADD COLUMN IF NOT EXISTS statement_length INTEGER;
+ALTER TABLE codeforces ADD COLUMN IF NOT EXISTS contest_name VARCHAR;
+ALTER TABLE codeforces ADD COLUMN IF NOT EXISTS division VARCHAR;
+ALTER TABLE codeforces ADD COLUMN IF NOT EXISTS details_fingerprint VARCHAR;
+CREATE TABLE IF NOT EXISTS fsm_state(
+chat_id BIGINT NOT NULL,
+user_id BIGINT NOT NULL,
+state VARCHAR,
+data JSONB NOT NULL DEFAULT '{}',
+PRIMARY KEY (chat_id, user_id));
+"""
+
+
+class Problem(NamedTuple):
+    """
+    Запись о задаче в том виде, в котором она попадает в БД
+    """
+    name: str
+    rank: int
+    count_solve: int
+    notice_lst: list
+    link: str
+    contest_id: int = None
+    problem_index: str = None
+    notice_titles: dict = None  # Названия категорий на языке страницы {ключ категории: название}, у API нет
+
+
+class Details(NamedTuple):
+    """
+    Сведения со страницы задачи
+    """
+    time_limit: float  # Ограничение времени на тест, с
+    memory_limit: int  # Ограничение памяти на тест, МБ
+    statement_length: int  # Длина условия в символах
+    contest_name: str
+    division: str  # Дивизион раунда, например "2" или "1+2"
 
 
 @singleton
@@ -15,13 +168,7 @@ class ConDB:
         """
         self.__insert_count = -1  # Равно -1, так как через метод insert происходит проверка созданы ли таблицы
 
-        self.__conn = psycopg2.connect(
-            database=os.getenv('DATABASE_NAME'),
-            user=os.getenv('DATABASE_USER'),
-            password=os.getenv('DATABASE_PASSWORD'),
-            host=os.getenv('DATABASE_HOST'),
-            port=os.getenv('DATABASE_PORT'),
-        )
+        self.__conn = psycopg2.connect(**_connection_params())
         logging.info('ConDB::Database Connected...')
         self._create_tables()
 
@@ -62,102 +209,554 @@ class ConDB:
     def get_insert_count(self):
         return self.__insert_count
 
+    @contextmanager
+    def transaction(self):
+        """
+        Выполнение нескольких запросов в одной транзакции
+        :return: курсор, изменения через который фиксируются одним commit при выходе из блока with
+        """
+        cur = self.__conn.cursor()
+        try:
+            yield cur
+            self.__conn.commit()
+        except Exception:
+            self.__conn.rollback()
+            raise
+        finally:
+            cur.close()
+
     def _create_tables(self):
-        query = """
-        CREATE TABLE IF NOT EXISTS codeforces(
-        id_codeforces SERIAL PRIMARY KEY, 
-        name VARCHAR, 
-        rank INTEGER, 
-        count_solve INTEGER,
-        link VARCHAR);
-        CREATE TABLE IF NOT EXISTS notice(
-        id_notice SERIAL PRIMARY KEY, 
-        notice_name VARCHAR);
-        CREATE TABLE IF NOT EXISTS notice_query(
-        id_notice_query BIGSERIAL PRIMARY KEY,
-        id_codeforces INTEGER NOT NULL REFERENCES codeforces, 
-        id_notice INTEGER NOT NULL REFERENCES notice,
-        UNIQUE (id_codeforces, id_notice));
+        self.insert(_tables_query())  # Алгоритм insert такой же, как и при создании таблицы
+
+
+@singleton
+class AsyncConDB:
+    """
+    Асинхронный доступ к PostgreSQL для бота.
+    Запросы выполняются в отдельных потоках на соединениях из пула ограниченного размера,
+    поэтому выполняющийся запрос не блокирует цикл событий
+    """
+    def __init__(self, pool_size: int = POOL_SIZE, query_timeout: int = QUERY_TIMEOUT, create_tables: bool = True):
+        """
+        Создание пула соединений и таблиц при необходимости
+        :param pool_size: максимальное количество одновременно открытых соединений
+        :param query_timeout: ограничение времени выполнения одного запроса в миллисекундах
+        :param create_tables: создать таблицы; False, если их уже создал родительский процесс функцией create_tables
+        """
+        self.__pool = ThreadedConnectionPool(
+            1, pool_size, **_connection_params(f'-c statement_timeout={query_timeout}'),
+        )
+        # Потоков не больше, чем соединений, поэтому ожидание свободного соединения происходит в очереди executor
+        self.__executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='AsyncConDB')
+        self.__lock = threading.Lock()
+        self.__in_use = 0
+        Metrics.REGISTRY.set('db_pool_size', pool_size)
+        logging.info('AsyncConDB::Database pool created...')
+        if create_tables:
+            self._execute(_tables_query(), None, fetch=False)
+
+    async def select(self, query: str, vars: tuple = None, *, name: str) -> list:
+        """
+        Выборка данных из БД
+        :param query: PostgreSQL запрос
+        :param vars: Последовательность атрибутов для формирования запроса
+        :param name: метка запроса в метриках db_query_seconds
+        :return: список данных
+        """
+        loop = asyncio.get_running_loop()
+        with Metrics.REGISTRY.timer('db_query_seconds', query=name):
+            return await loop.run_in_executor(self.__executor, self._execute, query, vars)
+
+    async def execute(self, query: str, vars: tuple = None, *, name: str) -> None:
+        """
+        Изменение данных в БД
+        :param query: PostgreSQL запрос
+        :param vars: Последовательность атрибутов для формирования запроса
+        :param name: метка запроса в метриках db_query_seconds
+        :return: None
         """
-        self.insert(query)  # Алгоритм insert такой же, как и при создании таблицы
+        loop = asyncio.get_running_loop()
+        with Metrics.REGISTRY.timer('db_query_seconds', query=name):
+            await loop.run_in_executor(self.__executor, self._execute, query, vars, False)
 
+    def close(self) -> None:
+        """
+        Закрытие всех соединений пула
+        :return: None
+        """
+        self.__executor.shutdown(wait=True)
+        self.__pool.closeall()
+        logging.info('AsyncConDB::Database pool close')
+
+    def _execute(self, query: str, vars: tuple, fetch: bool = True):
+        """
+        Выполнение запроса на свободном соединении из пула
+        :param query: PostgreSQL запрос
+        :param vars: Последовательность атрибутов для формирования запроса
+        :param fetch: вернуть результат выборки
+        :return: список данных или None
+        """
+        conn = self.__pool.getconn()
+        self._track_usage(1)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(query, vars)
+                res = cur.fetchall() if fetch else None
+            conn.commit()
+            return res
+        except Exception:
+            conn.rollback()
+            Metrics.REGISTRY.inc('db_query_errors')
+            raise
+        finally:
+            self._track_usage(-1)
+            self.__pool.putconn(conn)
 
-def update_database_codeforces(db: ConDB, name: str, rank: int, count_solve: int, notice_lst: list, link: str) -> None:
+    def _track_usage(self, delta: int) -> None:
+        """
+        Учёт занятых соединений пула для метрик
+        :param delta: +1 при выдаче соединения, -1 при возврате
+        :return: None
+        """
+        with self.__lock:
+            self.__in_use += delta
+            Metrics.REGISTRY.set('db_pool_in_use', self.__in_use)
+
+
+class TagCache:
     """
-    Обновление БД данными из таблицы с сайта Codeforces
+    Словарь категорий {имя: id} процесса парсера вместе с их названиями на языке сайта.
+    Загружается из БД один раз за обход, отсутствующие категории добавляются одним запросом
+    """
+    def __init__(self):
+        self.__ids = None
+        self.__titles = None
+
+    def reset(self) -> None:
+        """
+        Сброс словаря, при следующем обращении он будет загружен из БД заново
+        :return: None
+        """
+        self.__ids = None
+        self.__titles = None
+
+    def get_ids(self, db: ConDB, names, titles: dict = None) -> dict:
+        """
+        Поиск id категорий, отсутствующие в БД категории добавляются
+        :param db: Объект работающий с PostgreSQL
+        :param names: имена категорий
+        :param titles: названия категорий {имя: название} для добавляемых категорий
+        :return: словарь {имя категории: id} для всех переданных имён
+        """
+        self._load(db)
+        titles = titles or {}
+        missing = sorted({name for name in names if name not in self.__ids})
+        if missing:
+            query = """
+            INSERT INTO notice(notice_name, title) SELECT * FROM unnest(%s::VARCHAR[], %s::VARCHAR[])
+            ON CONFLICT (notice_name) DO UPDATE SET title=COALESCE(EXCLUDED.title, notice.title)
+            RETURNING notice_name, id_notice, title;
+            """
+            with db.transaction() as cur:  # Отдельная транзакция: в словарь попадают только сохранённые id
+                cur.execute(query, (missing, [titles.get(name) for name in missing]))
+                rows = cur.fetchall()
+            self.__ids.update((name, id_notice) for name, id_notice, title in rows)
+            self.__titles.update((name, title) for name, id_notice, title in rows)
+        return {name: self.__ids[name] for name in names}
+
+    def update_titles(self, db: ConDB, titles: dict) -> int:
+        """
+        Запись изменившихся названий уже известных категорий. Названия есть только у HTML-страниц,
+        поэтому обход через API названия не стирает
+        :param db: Объект работающий с PostgreSQL
+        :param titles: названия категорий {имя: название}
+        :return: количество категорий, у которых изменилось название
+        """
+        self._load(db)
+        changed = {name: title for name, title in titles.items()
+                   if title and name in self.__ids and self.__titles.get(name) != title}
+        if changed:
+            with db.transaction() as cur:
+                cur.execute("""
+                UPDATE notice n SET title=v.title FROM unnest(%s::VARCHAR[], %s::VARCHAR[]) AS v(notice_name, title)
+                WHERE n.notice_name=v.notice_name;
+                """, (list(changed), list(changed.values())))
+            self.__titles.update(changed)
+        return len(changed)
+
+    def _load(self, db: ConDB) -> None:
+        """
+        Загрузка словаря из БД, если он ещё не загружен
+        :param db: Объект работающий с PostgreSQL
+        :return: None
+        """
+        if self.__ids is None:
+            rows = db.select("SELECT notice_name, id_notice, title FROM notice;")
+            self.__ids = {name: id_notice for name, id_notice, title in rows}
+            self.__titles = {name: title for name, id_notice, title in rows}
+
+
+TAGS = TagCache()
+
+
+def _connection_params(options: str = '') -> dict:
+    """
+    Параметры подключения к БД из переменных окружения.
+    Если задана DATABASE_SCHEMA, таблицы ищутся и создаются в этой схеме, расширения - в public
+    :param options: дополнительные параметры сервера, например '-c statement_timeout=5000'
+    :return: словарь параметров для psycopg2
+    """
+    schema = os.getenv('DATABASE_SCHEMA')
+    if schema:
+        options = f'-c search_path={schema},public {options}'.strip()
+    params = {
+        'database': os.getenv('DATABASE_NAME'),
+        'user': os.getenv('DATABASE_USER'),
+        'password': os.getenv('DATABASE_PASSWORD'),
+        'host': os.getenv('DATABASE_HOST'),
+        'port': os.getenv('DATABASE_PORT'),
+    }
+    if options:
+        params['options'] = options
+    return params
+
+
+def _tables_query() -> str:
+    """
+    Запрос создания таблиц, перед которым при заданной DATABASE_SCHEMA создаётся сама схема
+    :return: PostgreSQL запрос
+    """
+    schema = os.getenv('DATABASE_SCHEMA')
+    if not schema:
+        return CREATE_TABLES_QUERY
+    return f'CREATE SCHEMA IF NOT EXISTS {schema};' + CREATE_TABLES_QUERY
+
+
+def create_tables() -> None:
+    """
+    Создание и обновление таблиц на отдельном соединении, которое закрывается сразу после запроса.
+    Выполняется один раз до запуска нескольких процессов, которые затем работают с готовыми таблицами
+    :return: None
+    """
+    conn = psycopg2.connect(**_connection_params())
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(_tables_query())
+    finally:
+        conn.close()
+    logging.info('ConnectDB::Tables created')
+
+
+def split_problem_number(number: str) -> tuple:
+    """
+    Разделение номера задачи на id контеста и индекс задачи в контесте
+    :param number: номер задачи, например "4A" или "1790F2"
+    :return: кортеж (id контеста, индекс) или (None, None), если номер не распознан
+    """
+    match = PROBLEM_NUMBER.fullmatch((number or '').strip())
+    if not match:
+        return None, None
+    return int(match.group(1)), match.group(2)
+
+
+def problem_fingerprint(problem: Problem) -> str:
+    """
+    Отпечаток задачи для инкрементального обхода.
+    Количество решений не учитывается: оно меняется постоянно и обновляется полным обходом
+    :param problem: объект Problem
+    :return: hex-строка хеша
+    """
+    key = '\x1f'.join((problem.name or '', str(problem.rank), problem.link or '', *sorted(problem.notice_lst or [])))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def get_fingerprints(db: ConDB) -> dict:
+    """
+    Выборка отпечатков всех задач из БД
+    :param db: Объект работающий с PostgreSQL
+    :return: словарь {(id контеста, индекс задачи): отпечаток}
+    """
+    rows = db.select("SELECT contest_id, problem_index, fingerprint FROM codeforces WHERE contest_id IS NOT NULL;")
+    return {(contest_id, problem_index): fingerprint for contest_id, problem_index, fingerprint in rows}
+
+
+def bump_catalog_version(db: ConDB) -> None:
+    """
+    Увеличение версии каталога, по которой бот определяет, что кеш сложностей и категорий устарел
     :param db: Объект работающий с PostgreSQL
-    :param name: имя добавляемой задачи
-    :param rank: rank добавляемой задачи
-    :param count_solve: количество решений добавляемой задачи
-    :param notice_lst: список категорий добавляемой задачи
-    :param link: ссылка на добавляемую задачу
     :return: None
     """
-    if _update_codeforces(db, name, rank, count_solve, link):
-        id_codeforces = _get_codeforces_id(db)
-        for notice_name in notice_lst:
-            id_notice = _get_notice_id(db, notice_name)
-            _add_notice_query(db, id_codeforces, id_notice)
+    db.insert("UPDATE catalog_version SET version=version+1;")
+
+
+async def get_catalog_version(db: AsyncConDB) -> int:
+    """
+    Выборка текущей версии каталога
+    :param db: Объект для асинхронной работы с PostgreSQL
+    :return: номер версии
+    """
+    return (await db.select("SELECT version FROM catalog_version;", name='catalog_version'))[0][0]
+
+
+def try_advisory_lock(db: ConDB, name: str) -> bool:
+    """
+    Попытка взять сессионную рекомендательную блокировку PostgreSQL без ожидания
+    :param db: Объект работающий с PostgreSQL
+    :param name: имя блокировки, одинаковое для всех экземпляров парсера
+    :return: True, если блокировка взята
+    """
+    with db.transaction() as cur:
+        cur.execute("SELECT pg_try_advisory_lock(hashtext(%s));", (name,))
+        return cur.fetchone()[0]
 
 
-def _update_codeforces(db: ConDB, name: str, rank: int, count_solve: int, link: str) -> bool:
+def advisory_unlock(db: ConDB, name: str) -> None:
     """
-    Вспомогательная функция по осуществлению запроса insert к таблице codeforces при отсутствии таких же данных в ней
+    Снятие блокировки, взятой try_advisory_lock
     :param db: Объект работающий с PostgreSQL
-    :param name: имя добавляемой задачи
-    :param rank: rank добавляемой задачи
-    :param count_solve: количество решений добавляемой задачи
-    :param link: ссылка на добавляемую задачу
-    :return: True, если произведена запись в БД, False в противном случае
+    :param name: имя блокировки
+    :return: None
     """
-    query = "SELECT name FROM codeforces WHERE codeforces.name=%s;"
-    vars = (name, )
-    if not db.select(query, vars):
-        query = "INSERT INTO codeforces(name, rank, count_solve, link) VALUES(%s, %s, %s, %s);"
-        vars = (name, rank, count_solve, link)
-        db.insert(query, vars)
-        return True
-    return False
+    with db.transaction() as cur:
+        cur.execute("SELECT pg_advisory_unlock(hashtext(%s));", (name,))
 
 
-def _get_codeforces_id(db: ConDB) -> int:
+def get_checkpoint(db: ConDB, crawl: str, max_age: float = None) -> tuple:
     """
-    Вспомогательная функция по осуществлению запроса select к таблице codeforces и возврату id найденных данных
+    Выборка страниц, уже записанных прерванным обходом. Учитывается только последний обход,
+    начатый не раньше max_age секунд назад: более старые отметки относятся к данным, которые успели устареть
     :param db: Объект работающий с PostgreSQL
-    :return: id последнего добавленного элемента таблицы
+    :param crawl: вид обхода
+    :param max_age: максимальный возраст прерванного обхода, с, None - без ограничения
+    :return: кортеж (id обхода, множество номеров страниц) или (None, пустое множество), если продолжать нечего
     """
-    query = "SELECT id_codeforces FROM codeforces ORDER BY id_codeforces DESC LIMIT 1;"
-    return db.select(query)[0][0]
+    rows = db.select("""
+    SELECT run_id, array_agg(page) FROM crawl_checkpoint WHERE crawl=%s
+    GROUP BY run_id HAVING %s IS NULL OR MIN(written_at) > now() - %s * interval '1 second'
+    ORDER BY MAX(written_at) DESC LIMIT 1;
+    """, (crawl, max_age, max_age))
+    if not rows:
+        return None, set()
+    return rows[0][0], set(rows[0][1])
 
 
-def _get_notice_id(db: ConDB, notice_name: str) -> int:
+def start_checkpoint(db: ConDB, crawl: str) -> int:
     """
-    Вспомогательная функция на осуществление запроса insert к таблице notice и возврату id добавленных данных
+    Начало нового обхода: отметки предыдущих обходов удаляются
     :param db: Объект работающий с PostgreSQL
-    :param notice_name: Имя, которое будет добавлено в таблицу
-    :return: id элемента с именем notice_name в таблице notice
+    :param crawl: вид обхода
+    :return: id нового обхода
     """
-    query_select = "SELECT id_notice FROM notice WHERE notice_name=%s;"
-    vars = (notice_name, )
-    id_notice = db.select(query_select, vars)
-    if not id_notice:
-        query_insert = "INSERT INTO notice(notice_name) VALUES(%s);"
-        db.insert(query_insert, vars)
-        id_notice = db.select(query_select, (notice_name, ))
-    return id_notice[0][0]
+    with db.transaction() as cur:
+        cur.execute("DELETE FROM crawl_checkpoint WHERE crawl=%s;", (crawl,))
+        cur.execute("SELECT nextval('crawl_run_seq');")
+        return cur.fetchone()[0]
 
 
-def _add_notice_query(db: ConDB, id_codeforces: int, id_notice: int) -> None:
+def save_checkpoint(db: ConDB, crawl: str, run_id: int, page: int) -> None:
     """
-    Вспомогательная функция по осуществлению запроса insert к таблице notice_query,
-    определяющей взаимосвязь таблиц notice и codeforces
+    Отметка о записи страницы обходом
     :param db: Объект работающий с PostgreSQL
-    :param id_codeforces: id элемента из таблицы codeforces
-    :param id_notice: id элемента из таблицы notice
+    :param crawl: вид обхода
+    :param run_id: id обхода из start_checkpoint или get_checkpoint
+    :param page: номер страницы
     :return: None
     """
-    query = "SELECT * FROM notice_query WHERE id_codeforces=%s AND id_notice=%s;"
-    vars = (id_codeforces, id_notice)
-    if not db.select(query, vars):
-        query = "INSERT INTO notice_query(id_codeforces, id_notice) VALUES(%s, %s);"
-        db.insert(query, vars)
+    db.insert("""
+    INSERT INTO crawl_checkpoint(crawl, page, run_id) VALUES (%s, %s, %s)
+    ON CONFLICT (crawl, page) DO UPDATE SET run_id=EXCLUDED.run_id, written_at=now();
+    """, (crawl, page, run_id))
+
+
+def clear_checkpoint(db: ConDB, crawl: str) -> None:
+    """
+    Удаление отметок завершённого обхода, следующий обход начнётся с первой страницы
+    :param db: Объект работающий с PostgreSQL
+    :param crawl: вид обхода
+    :return: None
+    """
+    db.insert("DELETE FROM crawl_checkpoint WHERE crawl=%s;", (crawl,))
+
+
+def refresh_solve_trend(db: ConDB) -> None:
+    """
+    Пересчёт сводки solve_trend: прирост количества решений за сутки и за неделю у задач,
+    по которым за последнюю неделю были записи в solve_history. Читается только недельный хвост истории
+    и по одной записи на задачу до начала периода, поэтому бот не сканирует всю историю
+    :param db: Объект работающий с PostgreSQL
+    :return: None
+    """
+    with db.transaction() as cur:
+        cur.execute("DELETE FROM solve_trend;")
+        cur.execute("""
+        INSERT INTO solve_trend(id_codeforces, solved_day, solved_week)
+        SELECT c.id_codeforces,
+        COALESCE(c.count_solve - COALESCE(
+            (SELECT h.count_solve FROM solve_history h WHERE h.id_codeforces=c.id_codeforces
+             AND h.crawl_ts <= now() - interval '1 day' ORDER BY h.crawl_ts DESC LIMIT 1),
+            (SELECT h.count_solve FROM solve_history h WHERE h.id_codeforces=c.id_codeforces
+             ORDER BY h.crawl_ts LIMIT 1)), 0),
+        COALESCE(c.count_solve - COALESCE(
+            (SELECT h.count_solve FROM solve_history h WHERE h.id_codeforces=c.id_codeforces
+             AND h.crawl_ts <= now() - interval '7 days' ORDER BY h.crawl_ts DESC LIMIT 1),
+            (SELECT h.count_solve FROM solve_history h WHERE h.id_codeforces=c.id_codeforces
+             ORDER BY h.crawl_ts LIMIT 1)), 0)
+        FROM codeforces c
+        WHERE c.id_codeforces IN (
+            SELECT id_codeforces FROM solve_history WHERE crawl_ts > now() - interval '7 days');
+        """)
+
+
+def refresh_read_model(db: ConDB) -> None:
+    """
+    Обновление представлений для чтения ботом: problem_facet - строка на каждую пару (задача, категория)
+    со сложностью и названием категории, facet_count - количество задач по парам (сложность, категория).
+    Обновление CONCURRENTLY не блокирует чтение представлений ботом
+    :param db: Объект работающий с PostgreSQL
+    :return: None
+    """
+    with db.transaction() as cur:
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY problem_facet;")
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY facet_count;")
+
+
+def get_details_queue(db: ConDB, limit: int) -> list:
+    """
+    Выборка задач, сведения со страниц которых ещё не загружены или загружены до изменения задачи.
+    Очередью служит сама таблица: загруженная задача получает details_fingerprint, равный отпечатку,
+    поэтому прерванная загрузка продолжается со следующих задач
+    :param db: Объект работающий с PostgreSQL
+    :param limit: максимальное количество задач
+    :return: список кортежей (id задачи, ссылка, отпечаток)
+    """
+    return db.select("""
+    SELECT id_codeforces, link, fingerprint FROM codeforces
+    WHERE link IS NOT NULL AND details_fingerprint IS DISTINCT FROM fingerprint
+    ORDER BY details_fingerprint IS NOT NULL, id_codeforces DESC
+    LIMIT %s;
+    """, (limit,))
+
+
+def update_details(db: ConDB, rows: list) -> None:
+    """
+    Пакетная запись сведений со страниц задач
+    :param db: Объект работающий с PostgreSQL
+    :param rows: список кортежей (id задачи, отпечаток, объект Details или None, если страница не найдена)
+    :return: None
+    """
+    if not rows:
+        return
+    with db.transaction() as cur:
+        execute_values(
+            cur,
+            """
+            UPDATE codeforces c SET time_limit=v.time_limit, memory_limit=v.memory_limit,
+            statement_length=v.statement_length, contest_name=v.contest_name, division=v.division,
+            details_fingerprint=v.fingerprint
+            FROM (VALUES %s) AS v(id_codeforces, fingerprint, time_limit, memory_limit, statement_length,
+            contest_name, division)
+            WHERE c.id_codeforces=v.id_codeforces;
+            """,
+            [(id_codeforces, fingerprint, *(details or Details(None, None, None, None, None)))
+             for id_codeforces, fingerprint, details in rows],
+            template='(%s, %s, %s::REAL, %s::INTEGER, %s::INTEGER, %s, %s)',
+        )
+
+
+def update_database_codeforces_bulk(db: ConDB, problems: list) -> tuple:
+    """
+    Пакетное обновление БД данными из таблицы с сайта Codeforces.
+    Задачи записываются одним INSERT ... ON CONFLICT по ключу (id контеста, индекс задачи),
+    связи с категориями заменяются текущими в той же транзакции, id и названия категорий берутся из словаря TAGS.
+    У уже существующих задач обновляются только изменившиеся строки.
+    Новые значения количества решений и сложности дописываются в solve_history, неизменившиеся пропускаются
+    :param db: Объект работающий с PostgreSQL
+    :param problems: список объектов Problem (страница сайта или весь обход)
+    :return: кортеж (количество добавленных задач, количество обновлённых задач, количество обновлённых задач,
+    у которых изменился отпечаток: название, сложность, ссылка или категории, а не только количество решений,
+    вместе с количеством категорий, у которых изменилось название)
+    """
+    # Дубликаты ключа в пакете запрещены для ON CONFLICT DO UPDATE
+    unique = {(p.contest_id, p.problem_index): p for p in problems if p.name and p.contest_id is not None}
+    if not unique:
+        return 0, 0, 0
+    titles = {name: title for p in unique.values() for name, title in (p.notice_titles or {}).items()}
+    tag_ids = TAGS.get_ids(db, {name for p in unique.values() for name in p.notice_lst or []}, titles)
+    changed_titles = TAGS.update_titles(db, titles)
+
+    with db.transaction() as cur:
+        cur.execute("""
+        CREATE TEMP TABLE tmp_codeforces(
+        contest_id INTEGER,
+        problem_index VARCHAR,
+        name VARCHAR,
+        rank INTEGER,
+        count_solve INTEGER,
+        link VARCHAR,
+        fingerprint VARCHAR) ON COMMIT DROP;
+        """)
+        execute_values(
+            cur,
+            """
+            INSERT INTO tmp_codeforces(contest_id, problem_index, name, rank, count_solve, link, fingerprint)
+            VALUES %s;
+            """,
+            [(p.contest_id, p.problem_index, p.name, p.rank, p.count_solve, p.link, problem_fingerprint(p))
+             for p in unique.values()],
+        )
+        cur.execute("""
+        INSERT INTO solve_history(id_codeforces, crawl_ts, count_solve, rank)
+        SELECT c.id_codeforces, now(), t.count_solve, t.rank
+        FROM tmp_codeforces t INNER JOIN codeforces c USING(contest_id, problem_index)
+        WHERE (c.count_solve, c.rank) IS DISTINCT FROM (t.count_solve, t.rank);
+        """)
+        cur.execute("""
+        SELECT COUNT(*) FROM tmp_codeforces t INNER JOIN codeforces c USING(contest_id, problem_index)
+        WHERE c.fingerprint IS DISTINCT FROM t.fingerprint;
+        """)
+        changed = cur.fetchone()[0] + changed_titles  # Новое название категории тоже меняет меню бота
+        cur.execute("""
+        INSERT INTO codeforces AS c(contest_id, problem_index, name, rank, count_solve, link, fingerprint)
+        SELECT t.contest_id, t.problem_index, t.name, t.rank, t.count_solve, t.link, t.fingerprint FROM tmp_codeforces t
+        ON CONFLICT (contest_id, problem_index) DO UPDATE SET name=EXCLUDED.name, rank=EXCLUDED.rank,
+        count_solve=EXCLUDED.count_solve, link=EXCLUDED.link, fingerprint=EXCLUDED.fingerprint
+        WHERE (c.name, c.rank, c.count_solve, c.link, c.fingerprint)
+        IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.rank, EXCLUDED.count_solve, EXCLUDED.link, EXCLUDED.fingerprint)
+        RETURNING xmax = 0, id_codeforces, count_solve, rank;
+        """)
+        results = cur.fetchall()
+        new_rows = [row[1:] for row in results if row[0]]  # xmax = 0 только у вставленных строк
+        inserted = len(new_rows)
+        updated = len(results) - inserted
+        execute_values(
+            cur,
+            "INSERT INTO solve_history(id_codeforces, crawl_ts, count_solve, rank) VALUES %s;",
+            new_rows,
+            template='(%s, now(), %s, %s)',
+        )
+        cur.execute("""
+        CREATE TEMP TABLE tmp_notice_query(
+        contest_id INTEGER,
+        problem_index VARCHAR,
+        id_notice INTEGER) ON COMMIT DROP;
+        """)
+        execute_values(
+            cur,
+            "INSERT INTO tmp_notice_query(contest_id, problem_index, id_notice) VALUES %s;",
+            [(p.contest_id, p.problem_index, tag_ids[name]) for p in unique.values() for name in set(p.notice_lst or [])],
+        )
+        # Связи, которых больше нет у задачи на сайте, удаляются, чтобы категории не накапливались
+        cur.execute("""
+        DELETE FROM notice_query nq USING tmp_codeforces t, codeforces c
+        WHERE c.contest_id=t.contest_id AND c.problem_index=t.problem_index AND nq.id_codeforces=c.id_codeforces
+        AND NOT EXISTS (SELECT 1 FROM tmp_notice_query v WHERE v.contest_id=t.contest_id
+        AND v.problem_index=t.problem_index AND v.id_notice=nq.id_notice);
+        """)
+        cur.execute("""
+        INSERT INTO notice_query(id_codeforces, id_notice)
+        SELECT c.id_codeforces, v.id_notice
+        FROM tmp_notice_query v
+        INNER JOIN codeforces c ON c.contest_id=v.contest_id AND c.problem_index=v.problem_index
+        ON CONFLICT DO NOTHING;
+        """)
+    return inserted, updated, changed
@@ -0,0 +1,90 @@
+import logging
+from collections import defaultdict
+
+from psycopg2.extras import execute_values
+
+import ConnectDB  # Созданный модуль
+
+
+CONTEST_SIZE = 10  # Количество задач в контесте
+
+
+def assign_contests(db: ConnectDB.ConDB, size: int = CONTEST_SIZE) -> int:
+    """
+    Распределение задач по контестам для каждой пары (сложность, категория) без пересечений:
+    каждая задача попадает не более чем в один контест.
+    Уже сделанные назначения сохраняются, распределяются только новые задачи и задачи,
+    у которых изменилась сложность или пропала категория.
+    Пары обрабатываются по возрастанию количества свободных задач, чтобы редкие категории получили задачи
+    раньше частых, а внутри пары первыми берутся задачи, входящие в наименьшее количество пар.
+    Неполные контесты пары дополняются новыми задачами до создания следующих.
+    Категории, у которых не осталось задач, удаляются вместе со своими контестами
+    :param db: Объект работающий с PostgreSQL
+    :param size: количество задач в контесте
+    :return: количество назначенных задач
+    """
+    with db.transaction() as cur:
+        cur.execute("""
+        DELETE FROM contest_problem cp USING contest ct
+        WHERE cp.id_contest=ct.id_contest AND NOT EXISTS (
+        SELECT 1 FROM codeforces c INNER JOIN notice_query nq USING(id_codeforces)
+        WHERE c.id_codeforces=cp.id_codeforces AND c.rank=ct.rank AND nq.id_notice=ct.id_notice);
+        """)
+        released = cur.rowcount
+        # Категории без задач, например записанные до перехода на ключи из ссылок текстом ссылки,
+        # удаляются вместе с их контестами: задачи из таких контестов уже освобождены запросом выше
+        cur.execute("""
+        DELETE FROM contest ct WHERE NOT EXISTS (SELECT 1 FROM notice_query nq WHERE nq.id_notice=ct.id_notice)
+        AND NOT EXISTS (SELECT 1 FROM contest_problem cp WHERE cp.id_contest=ct.id_contest);
+        """)
+        cur.execute("""
+        DELETE FROM notice n WHERE NOT EXISTS (SELECT 1 FROM notice_query nq WHERE nq.id_notice=n.id_notice)
+        AND NOT EXISTS (SELECT 1 FROM contest ct WHERE ct.id_notice=n.id_notice);
+        """)
+
+        cur.execute("""
+        SELECT c.id_codeforces, c.rank, nq.id_notice
+        FROM codeforces c INNER JOIN notice_query nq USING(id_codeforces)
+        WHERE c.rank IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM contest_problem cp WHERE cp.id_codeforces=c.id_codeforces);
+        """)
+        candidates = defaultdict(list)  # {(сложность, id категории): [id задачи]}
+        degree = defaultdict(int)  # {id задачи: количество пар, в которые она входит}
+        for id_codeforces, rank, id_notice in cur.fetchall():
+            candidates[(rank, id_notice)].append(id_codeforces)
+            degree[id_codeforces] += 1
+        if not candidates:
+            return 0
+
+        cur.execute("""
+        SELECT ct.id_contest, ct.rank, ct.id_notice, ct.num, COUNT(cp.id_codeforces)
+        FROM contest ct LEFT JOIN contest_problem cp USING(id_contest)
+        GROUP BY ct.id_contest;
+        """)
+        open_contests = defaultdict(list)  # {(сложность, id категории): [[id контеста, свободных мест]]}
+        last_num = defaultdict(int)  # {(сложность, id категории): номер последнего контеста}
+        for id_contest, rank, id_notice, num, count in cur.fetchall():
+            last_num[(rank, id_notice)] = max(last_num[(rank, id_notice)], num)
+            if count < size:
+                open_contests[(rank, id_notice)].append([id_contest, size - count])
+
+        assigned = {}  # {id задачи: id контеста}
+        for pair in sorted(candidates, key=lambda p: (len(candidates[p]), p)):
+            free = sorted((i for i in candidates[pair] if i not in assigned), key=lambda i: (degree[i], i))
+            for contest in open_contests[pair]:
+                take, free = free[:contest[1]], free[contest[1]:]
+                contest[1] -= len(take)
+                assigned.update((i, contest[0]) for i in take)
+            while free:  # Свободные места старых контестов заняты, остаток делится на новые контесты
+                last_num[pair] += 1
+                cur.execute(
+                    "INSERT INTO contest(rank, id_notice, num) VALUES (%s, %s, %s) RETURNING id_contest;",
+                    (*pair, last_num[pair]),
+                )
+                id_contest = cur.fetchone()[0]
+                take, free = free[:size], free[size:]
+                assigned.update((i, id_contest) for i in take)
+
+        execute_values(cur, "INSERT INTO contest_problem(id_codeforces, id_contest) VALUES %s;", list(assigned.items()))
+    logging.info(f'Contests::Released {released}, assigned {len(assigned)} problems')
+    return len(assigned)
@@ -0,0 +1,101 @@
+import copy
+import os
+from urllib.parse import urlparse
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.storage import BaseStorage
+from psycopg2.extras import Json
+
+import ConnectDB  # Созданный модуль
+
+
+FSM_STORAGE = os.getenv('BOT_FSM_STORAGE', 'memory')  # Хранилище состояний: memory, postgres или redis
+REDIS_URL = os.getenv('BOT_REDIS_URL', 'redis://localhost:6379/0')
+
+
+class PgStorage(BaseStorage):
+    """
+    Хранилище состояний и данных FSM в таблице fsm_state PostgreSQL, общее для всех процессов бота.
+    Запросы выполняются через пул AsyncConDB
+    """
+    async def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        chat, user = self.check_address(chat=chat, user=user)
+        rows = await ConnectDB.AsyncConDB().select(
+            "SELECT state FROM fsm_state WHERE chat_id=%s AND user_id=%s;", (chat, user), name='fsm_get_state',
+        )
+        if rows and rows[0][0] is not None:
+            return rows[0][0]
+        return self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default=None) -> dict:
+        chat, user = self.check_address(chat=chat, user=user)
+        rows = await ConnectDB.AsyncConDB().select(
+            "SELECT data FROM fsm_state WHERE chat_id=%s AND user_id=%s;", (chat, user), name='fsm_get_data',
+        )
+        if rows:
+            return rows[0][0]
+        return copy.deepcopy(default) if default else {}
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        chat, user = self.check_address(chat=chat, user=user)
+        await ConnectDB.AsyncConDB().execute("""
+        INSERT INTO fsm_state(chat_id, user_id, state) VALUES (%s, %s, %s)
+        ON CONFLICT (chat_id, user_id) DO UPDATE SET state=EXCLUDED.state;
+        """, (chat, user, self.resolve_state(state)), name='fsm_set_state')
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        chat, user = self.check_address(chat=chat, user=user)
+        await ConnectDB.AsyncConDB().execute("""
+        INSERT INTO fsm_state(chat_id, user_id, data) VALUES (%s, %s, %s)
+        ON CONFLICT (chat_id, user_id) DO UPDATE SET data=EXCLUDED.data;
+        """, (chat, user, Json(data or {})), name='fsm_set_data')
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        """
+        Дополнение данных одним запросом, без чтения: параллельные обновления из разных процессов не теряются
+        """
+        chat, user = self.check_address(chat=chat, user=user)
+        await ConnectDB.AsyncConDB().execute("""
+        INSERT INTO fsm_state(chat_id, user_id, data) VALUES (%s, %s, %s)
+        ON CONFLICT (chat_id, user_id) DO UPDATE SET data=fsm_state.data || EXCLUDED.data;
+        """, (chat, user, Json({**(data or {}), **kwargs})), name='fsm_update_data')
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        chat, user = self.check_address(chat=chat, user=user)
+        if with_data:
+            await ConnectDB.AsyncConDB().execute(
+                "DELETE FROM fsm_state WHERE chat_id=%s AND user_id=%s;", (chat, user), name='fsm_reset_state',
+            )
+        else:
+            await self.set_state(chat=chat, user=user, state=None)
+
+
+def create_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    """
+    Создание хранилища состояний FSM.
+    memory - в памяти процесса, подходит для одного процесса и тестов,
+    postgres и redis - общие для нескольких процессов и хостов
+    :param kind: вид хранилища
+    :return: хранилище для Dispatcher
+    """
+    if kind == 'memory':
+        return MemoryStorage()
+    if kind == 'postgres':
+        return PgStorage()
+    if kind == 'redis':
+        from aiogram.contrib.fsm_storage.redis import RedisStorage2  # Требует пакет aioredis
+
+        url = urlparse(REDIS_URL)
+        return RedisStorage2(
+            host=url.hostname or 'localhost',
+            port=url.port or 6379,
+            db=int(url.path.lstrip('/') or 0),
+            password=url.password,
+        )
+    raise ValueError(f'Unknown FSM storage: {kind}')
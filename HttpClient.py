@@ -0,0 +1,287 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import brotli  # noqa: F401  urllib3 распаковывает br только при установленном пакете
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+CACHE_DIR = os.getenv('PARSER_CACHE_DIR', '.http_cache')
+OFFLINE = os.getenv('PARSER_OFFLINE') == '1'  # Работа только с кешем, без обращения к сайту
+REQUEST_INTERVAL = float(os.getenv('PARSER_REQUEST_INTERVAL', 0.5))  # Минимальный интервал между запросами к хосту, с
+REQUEST_TIMEOUT = 30
+CHUNK_SIZE = 16 * 1024  # Размер части тела ответа при потоковой загрузке, байт
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 1.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+USER_AGENT = 'ParserCodeforces (+https://github.com/K-Mickey/ParserCodeforces)'
+
+
+class CacheMiss(requests.RequestException):
+    """
+    Страницы нет в кеше, а загрузка с сайта запрещена режимом offline
+    """
+
+
+class RateLimiter:
+    """
+    Ограничение частоты запросов к каждому хосту, общее для всех потоков
+    """
+    def __init__(self, interval: float):
+        """
+        :param interval: минимальный интервал между запросами к одному хосту в секундах
+        """
+        self.__interval = interval
+        self.__lock = threading.Lock()
+        self.__next_time = {}
+
+    def wait(self, host: str) -> None:
+        """
+        Ожидание момента, когда к хосту можно отправить следующий запрос
+        :param host: имя хоста
+        :return: None
+        """
+        with self.__lock:
+            now = time.monotonic()
+            start = max(now, self.__next_time.get(host, now))
+            self.__next_time[host] = start + self.__interval
+        time.sleep(start - now)
+
+
+class ResponseCache:
+    """
+    Кеш ответов на диске: тело и заголовки валидации (ETag, Last-Modified) по ключу URL
+    """
+    def __init__(self, directory: str):
+        """
+        :param directory: каталог для хранения кеша
+        """
+        self.__directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url: str) -> tuple:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.__directory, key + '.body'), os.path.join(self.__directory, key + '.json')
+
+    def get(self, url: str):
+        """
+        Поиск ответа в кеше
+        :param url: адрес страницы
+        :return: кортеж (заголовки, тело) или None
+        """
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def get_meta(self, url: str):
+        """
+        Поиск заголовков ответа в кеше без чтения тела
+        :param url: адрес страницы
+        :return: словарь заголовков или None
+        """
+        body_path, meta_path = self._paths(url)
+        if not os.path.exists(body_path):
+            return None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def read_chunks(self, url: str, chunk_size: int):
+        """
+        Чтение тела ответа из кеша по частям
+        :param url: адрес страницы
+        :param chunk_size: размер части в байтах
+        :return: генератор частей тела
+        """
+        with open(self._paths(url)[0], 'rb') as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def put_chunks(self, url: str, chunks, headers):
+        """
+        Сохранение ответа в кеш по мере получения частей тела. Файл тела заменяется только после получения
+        всего ответа, при обрыве загрузки кеш остаётся прежним
+        :param url: адрес страницы
+        :param chunks: итератор частей распакованного тела ответа
+        :param headers: заголовки ответа
+        :return: генератор тех же частей тела
+        """
+        body_path, meta_path = self._paths(url)
+        tmp_path = f'{body_path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, body_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._put_meta(meta_path, url, headers)
+
+    def put(self, url: str, body: bytes, headers) -> None:
+        """
+        Сохранение ответа в кеш. Файлы записываются атомарно, чтобы параллельные загрузки не портили кеш
+        :param url: адрес страницы
+        :param body: распакованное тело ответа
+        :param headers: заголовки ответа
+        :return: None
+        """
+        body_path, meta_path = self._paths(url)
+        _write_atomic(body_path, body)
+        self._put_meta(meta_path, url, headers)
+
+    @staticmethod
+    def _put_meta(meta_path: str, url: str, headers) -> None:
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        }
+        _write_atomic(meta_path, json.dumps(meta).encode())
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class HttpClient:
+    """
+    Общий HTTP-слой парсера: пул соединений, сжатие, ограничение частоты,
+    повторы с задержкой и условные запросы к кешу на диске
+    """
+    def __init__(self, cache_dir: str = CACHE_DIR, offline: bool = OFFLINE,
+                 interval: float = REQUEST_INTERVAL, pool_size: int = 10):
+        """
+        :param cache_dir: каталог кеша ответов, None - без кеша
+        :param offline: отдавать страницы только из кеша
+        :param interval: минимальный интервал между запросами к одному хосту в секундах
+        :param pool_size: размер пула соединений к одному хосту
+        """
+        self.__cache = ResponseCache(cache_dir) if cache_dir else None
+        self.__offline = offline
+        self.__rate_limiter = RateLimiter(interval)
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.__session.mount('https://', adapter)
+        self.__session.mount('http://', adapter)
+        self.__session.headers.update({'User-Agent': USER_AGENT, 'Accept-Encoding': ACCEPT_ENCODING})
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def get(self, url: str) -> bytes:
+        """
+        Загрузка страницы. При наличии копии в кеше отправляется условный запрос, ответ 304 считается попаданием
+        :param url: адрес страницы
+        :return: тело ответа
+        """
+        cached = self.__cache.get(url) if self.__cache else None
+        if self.__offline:
+            if cached is None:
+                raise CacheMiss(f'{url} is not cached')
+            self.cache_hits += 1
+            return cached[1]
+
+        headers = {}
+        if cached:
+            meta = cached[0]
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        r = self._request(url, headers)
+        if r.status_code == 304 and cached:
+            self.cache_hits += 1
+            return cached[1]
+        r.raise_for_status()
+        self.cache_misses += 1
+        if self.__cache:
+            self.__cache.put(url, r.content, r.headers)
+        return r.content
+
+    def stream(self, url: str, chunk_size: int = CHUNK_SIZE):
+        """
+        Потоковая загрузка страницы: тело отдаётся частями по мере получения и целиком в памяти не хранится.
+        Кеш и условные запросы работают так же, как в get
+        :param url: адрес страницы
+        :param chunk_size: размер части в байтах
+        :return: генератор частей тела ответа
+        """
+        meta = self.__cache.get_meta(url) if self.__cache else None
+        if self.__offline:
+            if meta is None:
+                raise CacheMiss(f'{url} is not cached')
+            self.cache_hits += 1
+            yield from self.__cache.read_chunks(url, chunk_size)
+            return
+
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        with self._request(url, headers, stream=True) as r:
+            if r.status_code == 304 and meta:
+                self.cache_hits += 1
+                yield from self.__cache.read_chunks(url, chunk_size)
+                return
+            r.raise_for_status()
+            self.cache_misses += 1
+            chunks = r.iter_content(chunk_size)
+            if self.__cache:
+                chunks = self.__cache.put_chunks(url, chunks, r.headers)
+            yield from chunks
+
+    def _request(self, url: str, headers: dict, stream: bool = False) -> requests.Response:
+        """
+        Запрос с ограничением частоты и повторами с экспоненциальной задержкой
+        :param url: адрес страницы
+        :param headers: дополнительные заголовки запроса
+        :param stream: не загружать тело ответа сразу
+        :return: ответ сервера, статус которого не требует повтора
+        """
+        host = urlparse(url).netloc
+        for attempt in range(MAX_RETRIES + 1):
+            self.__rate_limiter.wait(host)
+            retry_after = None
+            try:
+                r = self.__session.get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=stream)
+                if r.status_code not in RETRY_STATUSES:
+                    return r
+                error = f'status {r.status_code}'
+                retry_after = r.headers.get('Retry-After')
+                r.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt == MAX_RETRIES:
+                break
+            delay = BACKOFF_FACTOR * 2 ** attempt + random.uniform(0, BACKOFF_FACTOR)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            logging.warning(f'HttpClient::{url} failed ({error}), retry in {delay:.1f}s')
+            time.sleep(delay)
+        raise requests.HTTPError(f'{url} failed after {MAX_RETRIES + 1} attempts: {error}')
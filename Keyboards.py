@@ -0,0 +1,44 @@
+import json
+import os
+
+from aiogram import types
+
+import Catalog  # Созданный модуль
+import ResultCache  # Созданный модуль
+
+
+KEYBOARD_CACHE_SIZE = int(os.getenv('BOT_KEYBOARD_CACHE_SIZE', 1024))  # Максимальное количество клавиатур в кеше
+
+
+class KeyboardCache(ResultCache.ResultCache):
+    """
+    Кеш готовых инлайн клавиатур в виде JSON, который передаётся в reply_markup без повторной сборки.
+    Клавиатуры строятся из каталога и контестов, которые меняются только вместе с версией каталога,
+    поэтому время жизни у записей не ограничено, а кеш очищается целиком при смене версии
+    """
+    def __init__(self, catalog: Catalog.Catalog, size: int = KEYBOARD_CACHE_SIZE):
+        """
+        :param catalog: каталог, по версии которого определяется устаревание клавиатур
+        :param size: максимальное количество клавиатур, самые давние по использованию вытесняются
+        """
+        super().__init__(catalog, 'keyboard', size, ttl=float('inf'))
+
+    async def get(self, key: tuple, build) -> str:
+        """
+        Клавиатура из кеша или собранная функцией build при промахе
+        :param key: ключ клавиатуры, например (сложность,) или (сложность, категория)
+        :param build: функция без аргументов, возвращающая корутину с объектом InlineKeyboardMarkup
+        :return: клавиатура в JSON
+        """
+        async def load() -> str:
+            return render(await build())
+        return await super().get(key, load)
+
+
+def render(markup: types.InlineKeyboardMarkup) -> str:
+    """
+    Сериализация клавиатуры в том виде, в котором её принимает Telegram Bot API
+    :param markup: клавиатура
+    :return: клавиатура в JSON
+    """
+    return json.dumps(markup.to_python(), ensure_ascii=False)
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Registry:
+    """
+    Метрики процесса: счётчики, текущие значения и сводки времени выполнения (количество, сумма, максимум).
+    Выводятся в текстовом формате Prometheus или сохраняются в JSON-файл
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__counters = {}
+        self.__gauges = {}
+        self.__summaries = {}  # {(имя, метки): [количество, сумма, максимум]}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Увеличение счётчика
+        :param name: имя метрики
+        :param value: величина увеличения
+        :param labels: метки
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """
+        Запись текущего значения
+        :param name: имя метрики
+        :param value: значение
+        :param labels: метки
+        :return: None
+        """
+        with self.__lock:
+            self.__gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Добавление наблюдения в сводку
+        :param name: имя метрики
+        :param value: наблюдаемое значение, например время в секундах
+        :param labels: метки
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            summary = self.__summaries.setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Замер времени выполнения блока with, результат добавляется в сводку name
+        :param name: имя метрики
+        :param labels: метки
+        :return: None
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        """
+        :return: словарь со всеми метриками для записи в JSON
+        """
+        with self.__lock:
+            return {
+                'timestamp': time.time(),
+                'counters': [_entry(key, value) for key, value in self.__counters.items()],
+                'gauges': [_entry(key, value) for key, value in self.__gauges.items()],
+                'summaries': [_entry(key, {'count': s[0], 'sum': s[1], 'max': s[2]})
+                              for key, s in self.__summaries.items()],
+            }
+
+    def render(self) -> str:
+        """
+        :return: метрики в текстовом формате Prometheus
+        """
+        lines = []
+        with self.__lock:
+            for (name, labels), value in sorted(self.__counters.items()):
+                lines.append(f'{name}_total{_labels(labels)} {value}')
+            for (name, labels), value in sorted(self.__gauges.items()):
+                lines.append(f'{name}{_labels(labels)} {value}')
+            for (name, labels), (count, total, maximum) in sorted(self.__summaries.items()):
+                lines.append(f'{name}_count{_labels(labels)} {count}')
+                lines.append(f'{name}_sum{_labels(labels)} {total}')
+                lines.append(f'{name}_max{_labels(labels)} {maximum}')
+        return '\n'.join(lines) + '\n'
+
+    def flush(self, path: str) -> None:
+        """
+        Атомарная запись метрик в JSON-файл
+        :param path: путь к файлу
+        :return: None
+        """
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def _entry(key: tuple, value) -> dict:
+    name, labels = key
+    return {'name': name, 'labels': dict(labels), 'value': value}
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+async def flush_periodically(registry: Registry, path: str, interval: float) -> None:
+    """
+    Периодическая запись метрик в JSON-файл из цикла событий
+    :param registry: метрики процесса
+    :param path: путь к файлу
+    :param interval: период записи в секундах
+    :return: None
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            registry.flush(path)
+        except OSError as e:
+            logging.error(f'Metrics::flush::{e}')
+
+
+REGISTRY = Registry()
@@ -1,10 +1,22 @@
-from bs4 import BeautifulSoup
-import bs4
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+import itertools
+import lxml.etree
+import lxml.html
 import requests
 import logging
+import multiprocessing
+import os
 import time
-import tqdm
+from urllib.parse import parse_qs, urlparse
+import CodeforcesApi  # Созданный модуль
 import ConnectDB  # Созданный модуль
+import Contests  # Созданный модуль
+import HttpClient  # Созданный модуль
+import Metrics  # Созданный модуль
+import ProblemDetails  # Созданный модуль
+import Scheduler  # Созданный модуль
 
 
 logging.basicConfig(filename='parser.log', level=logging.INFO, format='[%(asctime)s: %(levelname)s] %(message)s')
@@ -12,23 +24,61 @@ logging.basicConfig(filename='parser.log', level=logging.INFO, format='[%(asctim
 BASE_URL = 'https://codeforces.com'
 POSTFIX_URL = '?order=BY_SOLVED_DESC&locale=ru'
 URL = f'{BASE_URL}/problemset{POSTFIX_URL}'
-SLEEP_MINUTE = 60
+PAGE_URL = f'{BASE_URL}/problemset/page/{{}}{POSTFIX_URL}'
+NEWEST_URL = f'{BASE_URL}/problemset?locale=ru'  # Порядок по умолчанию: сначала новые задачи
+NEWEST_PAGE_URL = f'{BASE_URL}/problemset/page/{{}}?locale=ru'
+FULL_INTERVAL_MINUTE = int(os.getenv('PARSER_FULL_INTERVAL', 24 * 60))  # Период полного обхода
+INCREMENTAL_INTERVAL_MINUTE = int(os.getenv('PARSER_INCREMENTAL_INTERVAL', 60))  # Период инкрементального обхода
+HOT_INTERVAL_MINUTE = int(os.getenv('PARSER_HOT_INTERVAL', 15))  # Период обновления первых страниц
+HOT_PAGES = int(os.getenv('PARSER_HOT_PAGES', 3))  # Количество первых страниц "сначала новые" для частого обновления
+DETAIL_INTERVAL_MINUTE = int(os.getenv('PARSER_DETAIL_INTERVAL', 15))  # Период загрузки страниц задач
+DETAIL_LIMIT = int(os.getenv('PARSER_DETAIL_LIMIT', 1000))  # Максимальное количество страниц задач за один запуск
+DETAIL_WORKERS = int(os.getenv('PARSER_DETAIL_WORKERS', 2))  # Количество одновременно загружаемых страниц задач
+DETAIL_BATCH_SIZE = 50  # Количество задач в одном пакете записи сведений
+JITTER_SECOND = int(os.getenv('PARSER_JITTER', 60))  # Максимальная случайная задержка запуска
+LOCK_NAME = 'parser_codeforces_crawl'  # Рекомендательная блокировка: одновременно работает только один обход
+CHECKPOINT = 'site'  # Вид обхода в crawl_checkpoint: прерванный обход parse_site продолжается с незаписанных страниц
+# Прерванный обход продолжается, только если он начат не раньше этого срока, минуты
+CHECKPOINT_MAX_AGE_MINUTE = int(os.getenv('PARSER_CHECKPOINT_MAX_AGE', FULL_INTERVAL_MINUTE // 2))
+KNOWN_PAGES_TO_STOP = 1  # Количество подряд идущих страниц без изменений, после которых обход прекращается
+
+SOURCE = os.getenv('PARSER_SOURCE', 'api')  # Источник полного обхода: api или html
+API_BATCH_SIZE = 1000  # Количество задач в одном пакете записи при обходе через API
+
+MAX_WORKERS = int(os.getenv('PARSER_WORKERS', 4))  # Количество одновременно загружаемых страниц
+PARSE_PROCESSES = int(os.getenv('PARSER_PROCESSES', 0))  # Количество процессов для разбора страниц, 0 - без пула
+STREAM = os.getenv('PARSER_STREAM') == '1'  # Потоковый разбор страниц без построения дерева документа
+
+HTTP_CLIENT = HttpClient.HttpClient(pool_size=MAX_WORKERS)
+# Страницы задач загружаются один раз после изменения задачи, поэтому на диске не кешируются
+DETAIL_CLIENT = HttpClient.HttpClient(cache_dir=None, pool_size=DETAIL_WORKERS)
+METRICS = Metrics.REGISTRY
+METRICS_FILE = os.getenv('PARSER_METRICS_FILE', 'parser_metrics.json')  # Метрики сохраняются после каждого обхода
+
+# Выражения для пагинатора компилируются один раз, строки таблицы разбираются в parse_row за один проход
+XPATH_PAGINATOR = lxml.etree.XPath("//div[contains(concat(' ', normalize-space(@class), ' '), ' pagination ')]")
+XPATH_PAGE_INDEX = lxml.etree.XPath(".//span[contains(concat(' ', normalize-space(@class), ' '), ' page-index ')]")
 
 
 def dispatcher():
     """
-    Организация работы парсера сайта Codeforces
+    Организация работы парсера сайта Codeforces: полный обход сразу после запуска и затем раз в
+    FULL_INTERVAL_MINUTE, инкрементальный обход и обновление первых страниц по своим расписаниям
     :return:
     """
     print("Hello, I'm running!")
     logging.info(f"parser::{'-' * 10}Start program...{'-' * 10}")
+    scheduler = Scheduler.Scheduler(guard=_crawl_lock)
+    full_runs = itertools.count()
+    # Первый полный обход после запуска продолжает обход, прерванный остановкой парсера, остальные начинаются заново
+    scheduler.add('full', lambda: parse_full(resume=next(full_runs) == 0), FULL_INTERVAL_MINUTE * 60,
+                  jitter=JITTER_SECOND)
+    scheduler.add('incremental', parse_site_incremental, INCREMENTAL_INTERVAL_MINUTE * 60,
+                  jitter=JITTER_SECOND, delay=INCREMENTAL_INTERVAL_MINUTE * 60)
+    scheduler.add('hot', parse_hot, HOT_INTERVAL_MINUTE * 60, jitter=JITTER_SECOND, delay=HOT_INTERVAL_MINUTE * 60)
+    scheduler.add('details', parse_details, DETAIL_INTERVAL_MINUTE * 60, jitter=JITTER_SECOND)
     try:
-        while True:
-            parse_site()
-            logging.info(f'parser::Parser start sleep...')
-            for _ in tqdm.trange(SLEEP_MINUTE, desc='Minutes to next run'):
-                time.sleep(60)
-            logging.info(f'parser::Parser wakes up...')
+        scheduler.run_forever()
     except KeyboardInterrupt:
         pass
     finally:
@@ -37,160 +87,516 @@ def dispatcher():
         print("Bye, bye! I'm done!")
 
 
-def parse_site():
+@contextmanager
+def _crawl_lock():
+    """
+    Блокировка обхода, общая для всех экземпляров парсера, работающих с одной БД
+    :return: True, если блокировка взята
     """
-    Организация парсинга сайта
+    database = ConnectDB.ConDB()
+    acquired = ConnectDB.try_advisory_lock(database, LOCK_NAME)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            ConnectDB.advisory_unlock(database, LOCK_NAME)
+
+
+def parse_full(resume: bool = False) -> tuple:
+    """
+    Полный обход из источника SOURCE. Если API недоступно, обход выполняется по HTML-страницам
+    :param resume: продолжить прерванный обход HTML-страниц
+    :return: кортеж (количество добавленных задач, количество обновлённых задач)
+    """
+    if SOURCE == 'api':
+        try:
+            return parse_api()
+        except requests.RequestException as e:
+            logging.error(f'parser::API crawl failed, falling back to HTML: {e}')
+    return parse_site(resume=resume)
+
+
+def parse_api(batch_size: int = API_BATCH_SIZE) -> tuple:
+    """
+    Полный обход через API Codeforces: все задачи приходят одним ответом и записываются в БД пакетами
+    :param batch_size: количество задач в одном пакете записи
+    :return: кортеж (количество добавленных задач, количество обновлённых задач)
+    """
+    database = ConnectDB.ConDB()
+    ConnectDB.TAGS.reset()
+    stats = Counter()
+    started = time.perf_counter()
+    logging.info('parser::The parser started working with the API')
+    try:
+        with METRICS.timer('parser_fetch_seconds', source='api'):
+            problems = CodeforcesApi.fetch_problems(HTTP_CLIENT)
+        batch = []
+        for problem in problems:
+            batch.append(problem)
+            if len(batch) >= batch_size:
+                stats.update(_write_page(database, batch))
+                batch = []
+        stats.update(_write_page(database, batch))
+    except KeyboardInterrupt:
+        logging.info('parser::User pressed stop.')
+    finally:
+        _finish_crawl(database, 'api', stats, started)
+    return stats['inserted'], stats['updated']
+
+
+def parse_site(workers: int = MAX_WORKERS, processes: int = PARSE_PROCESSES, stream: bool = STREAM,
+               resume: bool = False) -> tuple:
+    """
+    Организация парсинга сайта.
+    По первой странице определяется количество страниц, остальные загружаются параллельно.
+    Разбор страниц идёт в основном потоке или, если processes > 0, в пуле процессов,
+    в потоковом режиме - в потоках загрузки по мере получения тела страницы (fetch_rows),
+    запись в БД всегда выполняется в основном потоке по мере готовности страниц.
+    Записанные страницы отмечаются в crawl_checkpoint с id обхода. Обход с resume, запущенный не позже
+    CHECKPOINT_MAX_AGE_MINUTE после начала прерванного, загружает только его оставшиеся страницы,
+    остальные обходы начинаются заново. Отметки удаляются, когда записаны все страницы
     database: объект БД
-    bs: код страницы
-    parse_page: парсинг страницы и добавление в БД
-    find_next_page: поиск ссылки на следующую страницу
-    :return:
+    fetch_page: загрузка страницы через общий HTTP-клиент с кешем
+    parse_html: парсинг страницы
+    update_database_codeforces_bulk: пакетная запись страницы в БД
+    :param workers: количество одновременно загружаемых страниц
+    :param processes: количество процессов для разбора страниц, 0 - разбор в основном потоке
+    :param stream: потоковый разбор страниц, кроме первой
+    :param resume: продолжить прерванный обход
+    :return: кортеж (количество добавленных задач, количество обновлённых задач)
     """
     database = ConnectDB.ConDB()
-    cur_url = URL
-    count_page = 0
+    ConnectDB.TAGS.reset()
+    stats = Counter()
+    started = time.perf_counter()
+    run_id, written = None, set()
+    if resume:
+        run_id, written = ConnectDB.get_checkpoint(database, CHECKPOINT, CHECKPOINT_MAX_AGE_MINUTE * 60)
+    if run_id is None:
+        run_id = ConnectDB.start_checkpoint(database, CHECKPOINT)
     logging.info('parser::The parser started working with the site')
     try:
-        while True:
-            count_page += 1
-            logging.debug(f'Parsing {count_page} page.')
-
-            r = requests.get(url=cur_url)
-            if not r.raise_for_status():
-                bs = BeautifulSoup(r.text, 'lxml')
-                table = bs.find_all('tr')
-
-                parse_page(database, table)
-
-                try:
-                    cur_url = find_next_page(bs)
-                except AttributeError:
-                    logging.info(f'parser::Page {count_page} last. Except AttributeError.')
-                    logging.info(f'parser::The number of records added to the database = {database.get_insert_count()}')
-                    break
+        page = load_page(fetch_page(URL))
+        page_count = find_page_count(page)
+        logging.info(f'parser::Found {page_count} pages, {len(written)} already written by the interrupted crawl')
+        if 1 not in written:
+            stats.update(_write_page(database, parse_page(page), page=1, run_id=run_id))
+        del page
+
+        # Процессы разбора запускаются через forkserver: при fork они могли бы унаследовать блокировки метрик,
+        # логирования и HTTP-клиента, взятые в этот момент потоками загрузки, и зависнуть на них
+        with ThreadPoolExecutor(max_workers=workers) as pool, \
+                ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('forkserver')) \
+                if processes and not stream else nullcontext() as parser:
+            fetch = fetch_rows if stream else fetch_page
+            futures = {pool.submit(fetch, PAGE_URL.format(num)): num
+                       for num in range(2, page_count + 1) if num not in written}
+            parsed = {}
+            try:
+                for future in as_completed(futures):
+                    num = futures.pop(future)  # Загруженная страница больше нигде не хранится после записи
+                    logging.debug(f'Parsing {num} page.')
+                    try:
+                        result = future.result()
+                    except requests.RequestException as e:
+                        logging.error(f'parser::Page {num} skipped: {e}')
+                        continue
+                    if stream:  # fetch_rows уже вернул разобранные строки
+                        stats.update(_write_page(database, result, page=num, run_id=run_id))
+                        continue
+                    if parser is None:
+                        stats.update(_write_page(database, parse_page(load_page(result)), page=num, run_id=run_id))
+                        continue
+                    parsed[parser.submit(parse_html, result)] = num
+                    for done in [f for f in parsed if f.done()]:
+                        stats.update(_write_parsed(database, done, parsed.pop(done), run_id))
+                for done in as_completed(list(parsed)):
+                    stats.update(_write_parsed(database, done, parsed.pop(done), run_id))
+            except KeyboardInterrupt:
+                for future in (*futures, *parsed):
+                    future.cancel()
+                raise
+        if ConnectDB.get_checkpoint(database, CHECKPOINT)[1].issuperset(range(1, page_count + 1)):
+            ConnectDB.clear_checkpoint(database, CHECKPOINT)
     except KeyboardInterrupt:
-        logging.info(f'parser::User pressed stop. The number of records added to the database = {database.get_insert_count()}')
+        logging.info('parser::User pressed stop.')
+    finally:
+        _finish_crawl(database, 'full', stats, started)
+    return stats['inserted'], stats['updated']
 
 
-def find_next_page(page: BeautifulSoup) -> str:
+def _write_parsed(database: ConnectDB.ConDB, future: Future, num: int, run_id: int) -> dict:
     """
-    Поиск и формирование ссылки на следующую страницу
-    :param page: объект BeatifulSoup
-    :return: ссылка на следующую страницу
+    Вспомогательная функция для записи в БД страницы, разобранной в пуле процессов
+    :param database: объект БД
+    :param future: результат parse_html из пула процессов
+    :param num: номер страницы для записи в лог
+    :param run_id: id обхода для отметки в crawl_checkpoint
+    :return: словарь с количеством добавленных, обновлённых и пропущенных задач
     """
-    paginator = page.find('div', class_='pagination')
-    cur_page = paginator.find('span', class_='page-index active')
-    next_page = cur_page.find_next('span', class_='page-index').find('a')
-    return f"{BASE_URL}/{next_page.attrs['href']}&locale=ru"
+    try:
+        rows = future.result()
+    except Exception as e:
+        logging.error(f'parser::Page {num} skipped: {e}')
+        return {}
+    return _write_page(database, [ConnectDB.Problem(*row) for row in rows], page=num, run_id=run_id)
 
 
-def parse_page(db: ConnectDB.ConDB, table: BeautifulSoup) -> None:
+def _write_page(database: ConnectDB.ConDB, problems: list, unchanged: int = 0, page: int = None,
+                run_id: int = None) -> dict:
     """
-    Парсинг таблицы на странице сайта и добавление данных в БД
-    :param db: объект для работа с PostgreSQL
-    :param table: объект BeautifulSoup
-    :return:
+    Вспомогательная функция для пакетной записи страницы в БД с замером времени записи
+    :param database: объект БД
+    :param problems: список объектов Problem для записи
+    :param unchanged: количество задач страницы, отброшенных до записи как неизменившиеся
+    :param page: номер страницы обхода parse_site для отметки в crawl_checkpoint
+    :param run_id: id обхода parse_site
+    :return: словарь с количеством добавленных, обновлённых и пропущенных задач и задач с изменившимся отпечатком
     """
-    for i, v in enumerate(table):
-        string = table[i]
-
-        if not string.find('th'):
-            ConnectDB.update_database_codeforces(
-                db,
-                parse_name(string) + ' - ' + parse_number(string),
-                parse_rank(string),
-                parse_count_solve(string),
-                parse_notice(string),
-                parse_link(string),
-            )
+    inserted, updated, changed = 0, 0, 0
+    if problems:
+        with METRICS.timer('parser_db_write_seconds'):
+            inserted, updated, changed = ConnectDB.update_database_codeforces_bulk(database, problems)
+    if page is not None:
+        ConnectDB.save_checkpoint(database, CHECKPOINT, run_id, page)
+    stats = {'inserted': inserted, 'updated': updated, 'skipped': len(problems) - inserted - updated + unchanged}
+    for result, count in stats.items():
+        METRICS.inc('parser_rows', count, result=result)
+    return {**stats, 'changed': changed}
 
 
-def parse_number(string: bs4.BeautifulSoup) -> str:
+def _finish_crawl(database: ConnectDB.ConDB, mode: str, stats: Counter, started: float) -> None:
     """
-    Поиск номера задачи в строке таблицы
-    :param string: строка таблицы
-    :return: номер задачи в str
+    Завершение обхода, запись итогов в лог и метрики. Если изменилось только количество решений,
+    пересчитываются сводка популярности и представления для бота. Распределение задач по контестам
+    и смена версии каталога, которая сбрасывает кеши бота, выполняются только при добавлении задач,
+    изменении их сложности, названия, ссылки или категорий и при изменении названий категорий
+    :param database: объект БД
+    :param mode: вид обхода для метрик
+    :param stats: количество добавленных, обновлённых, пропущенных задач и задач с изменившимся отпечатком
+    :param started: время начала обхода по time.perf_counter
+    :return: None
     """
+    catalog_changed = stats['inserted'] or stats['changed']
+    if catalog_changed or stats['updated']:
+        if catalog_changed:
+            Contests.assign_contests(database)
+        ConnectDB.refresh_solve_trend(database)
+        ConnectDB.refresh_read_model(database)
+        if catalog_changed:
+            ConnectDB.bump_catalog_version(database)
+    for result in ('inserted', 'updated', 'skipped'):
+        METRICS.set('parser_last_crawl_rows', stats[result], mode=mode, result=result)
+    METRICS.set('parser_last_crawl_seconds', time.perf_counter() - started, mode=mode)
+    METRICS.set('parser_last_crawl_timestamp', time.time(), mode=mode)
+    METRICS.set('parser_http_cache_hits', HTTP_CLIENT.cache_hits)
+    METRICS.set('parser_http_cache_misses', HTTP_CLIENT.cache_misses)
     try:
-        number = string.find('td', class_='id').text.strip()
-    except AttributeError as e:
-        logging.error(f'parse_number: {e}')
-        number = None
-    return number
+        METRICS.flush(METRICS_FILE)
+    except OSError as e:
+        logging.error(f'parser::Metrics not saved: {e}')
+    logging.info(f"parser::Records inserted into the database = {stats['inserted']}, updated = {stats['updated']}, "
+                 f"skipped = {stats['skipped']}")
+    logging.info(f'parser::HTTP cache hits = {HTTP_CLIENT.cache_hits}, misses = {HTTP_CLIENT.cache_misses}')
 
 
-def parse_name(string: bs4.BeautifulSoup) -> str:
+def parse_site_incremental() -> tuple:
     """
-    Поиск имени задачи в строке таблицы
-    :param string: строка таблицы
-    :return: имя задачи в str
+    Инкрементальный обход сайта в порядке "сначала новые".
+    В БД записываются только задачи, отпечаток которых отличается от сохранённого,
+    обход прекращается после KNOWN_PAGES_TO_STOP страниц без изменений.
+    Изменения количества решений у старых задач подхватывает периодический полный обход parse_site
+    :return: кортеж (количество добавленных задач, количество обновлённых задач)
     """
+    database = ConnectDB.ConDB()
+    ConnectDB.TAGS.reset()
+    known = ConnectDB.get_fingerprints(database)
+    stats = Counter()
+    started = time.perf_counter()
+    known_pages = 0
+    logging.info('parser::The incremental parser started working with the site')
     try:
-        name = string.find('div', style='float: left;').text.strip()
-    except AttributeError as e:
-        logging.error(f'parse_name: {e}')
-        name = None
-    return name
+        page = load_page(fetch_page(NEWEST_URL))
+        page_count = find_page_count(page)
+        num = 1
+        while True:
+            problems = parse_page(page)
+            changed = [p for p in problems
+                       if known.get((p.contest_id, p.problem_index)) != ConnectDB.problem_fingerprint(p)]
+            stats.update(_write_page(database, changed, unchanged=len(problems) - len(changed)))
+            known_pages = 0 if changed else known_pages + 1
+            if known_pages >= KNOWN_PAGES_TO_STOP or num >= page_count:
+                logging.info(f'parser::Incremental crawl stopped on page {num}')
+                break
+            num += 1
+            page = load_page(fetch_page(NEWEST_PAGE_URL.format(num)))
+    except KeyboardInterrupt:
+        logging.info('parser::User pressed stop.')
+    finally:
+        _finish_crawl(database, 'incremental', stats, started)
+    return stats['inserted'], stats['updated']
 
 
-def parse_notice(string: bs4.BeautifulSoup) -> list:
+def parse_hot(pages: int = HOT_PAGES) -> tuple:
     """
-    Поиск тематик задач
-    :param string: строка таблицы
-    :return: список тематик задачи
+    Частое обновление первых страниц в порядке "сначала новые": у задач недавних раундов быстрее всего
+    меняется количество решений, которое инкрементальный обход не учитывает.
+    Записываются все задачи страниц, неизменившиеся строки отбрасывает сама пакетная запись
+    :param pages: количество страниц
+    :return: кортеж (количество добавленных задач, количество обновлённых задач)
     """
+    database = ConnectDB.ConDB()
+    ConnectDB.TAGS.reset()
+    stats = Counter()
+    started = time.perf_counter()
+    logging.info(f'parser::The hot pages parser started working with the first {pages} pages')
     try:
-        notice = [i.text.strip() for i in string.find_all('a', class_='notice')]
-    except AttributeError as e:
-        logging.error(f'parse_notice {e}')
-        notice = None
-    return notice
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            urls = [NEWEST_URL, *(NEWEST_PAGE_URL.format(num) for num in range(2, pages + 1))]
+            for num, problems in enumerate(pool.map(fetch_rows if STREAM else _fetch_rows_tree, urls), start=1):
+                logging.debug(f'Parsing hot page {num}.')
+                stats.update(_write_page(database, problems))
+    except KeyboardInterrupt:
+        logging.info('parser::User pressed stop.')
+    finally:
+        _finish_crawl(database, 'hot', stats, started)
+    return stats['inserted'], stats['updated']
 
 
-def parse_rank(string: bs4.BeautifulSoup) -> int:
+def parse_details(limit: int = DETAIL_LIMIT, workers: int = DETAIL_WORKERS,
+                  batch_size: int = DETAIL_BATCH_SIZE) -> int:
     """
-    Поиск сложности задачи
-    :param string:  строка таблицы
-    :return: Сложность задачи в int
+    Загрузка страниц новых и изменившихся задач: ограничения времени и памяти, длина условия,
+    название и дивизион раунда. Страницы загружаются пулом из workers потоков с ограничением частоты
+    запросов DETAIL_CLIENT, сведения записываются пакетами по batch_size задач.
+    Задачи, страницы которых не загрузились, остаются в очереди до следующего запуска
+    :param limit: максимальное количество задач за запуск
+    :param workers: количество одновременно загружаемых страниц
+    :param batch_size: количество задач в одном пакете записи
+    :return: количество записанных задач
     """
+    database = ConnectDB.ConDB()
+    started = time.perf_counter()
+    queue = ConnectDB.get_details_queue(database, limit)
+    written = 0
+    logging.info(f'parser::The details parser started working with {len(queue)} problems')
     try:
-        rank = string.find('span', class_='ProblemRating')
-        if rank:
-            rank = int(rank.text.strip())
-    except (AttributeError, ValueError) as e:
-        logging.error(f'parse_rank: {e}')
-        rank = None
-    return rank
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for start in range(0, len(queue), batch_size):
+                rows = [row for row in pool.map(_fetch_details, queue[start:start + batch_size]) if row]
+                ConnectDB.update_details(database, rows)
+                written += len(rows)
+    except KeyboardInterrupt:
+        logging.info('parser::User pressed stop.')
+    finally:
+        METRICS.set('parser_last_details_rows', written)
+        METRICS.set('parser_last_details_seconds', time.perf_counter() - started)
+        METRICS.set('parser_details_queue', len(queue) - written)
+        logging.info(f'parser::Problem details written = {written} of {len(queue)}')
+    return written
 
 
-def parse_count_solve(string: bs4.BeautifulSoup) -> int:
+def _fetch_details(task: tuple):
     """
-    Поиск количества решений задачи
-    :param string: строка таблицы
-    :return: количество решений в int
+    Вспомогательная функция для загрузки и разбора страницы одной задачи в пуле потоков
+    :param task: кортеж (id задачи, ссылка, отпечаток) из очереди
+    :return: кортеж (id задачи, отпечаток, объект Details или None для отсутствующей страницы)
+    или None, если страницу нужно загрузить позже
     """
+    id_codeforces, link, fingerprint = task
+    url = f'{BASE_URL}{link}?locale=ru'
+    with METRICS.timer('parser_fetch_seconds', source='details'):
+        try:
+            html = DETAIL_CLIENT.get(url)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                METRICS.inc('parser_fetch_errors')
+                logging.error(f'parser::Details of {link} skipped: {e}')
+                return None
+            return id_codeforces, fingerprint, None
+        except requests.RequestException as e:
+            METRICS.inc('parser_fetch_errors')
+            logging.error(f'parser::Details of {link} skipped: {e}')
+            return None
     try:
-        count_solve = string.find('a', title='Participants solved the problem')
-        if count_solve:
-            count_solve = int(count_solve.text.strip()[1:])
-    except (AttributeError, IndexError, ValueError) as e:
-        logging.error(f'parse_count_solve {e}')
-        count_solve = None
-    return count_solve
+        return id_codeforces, fingerprint, ProblemDetails.parse_details(html)
+    except lxml.etree.LxmlError as e:
+        logging.error(f'parser::Details of {link} not parsed: {e}')
+        return id_codeforces, fingerprint, None
+
+
+def fetch_page(url: str) -> bytes:
+    """
+    Загрузка страницы через общий HTTP-клиент: пул соединений, сжатие, ограничение частоты,
+    повторы с задержкой и кеш ответов на диске
+    :param url: адрес страницы
+    :return: тело страницы
+    """
+    with METRICS.timer('parser_fetch_seconds'):
+        try:
+            return HTTP_CLIENT.get(url)
+        except requests.RequestException:
+            METRICS.inc('parser_fetch_errors')
+            raise
+
+
+def fetch_rows(url: str) -> list:
+    """
+    Потоковая загрузка и разбор страницы: тело подаётся парсеру частями по мере получения,
+    дерево документа целиком не строится
+    :param url: адрес страницы
+    :return: список объектов Problem
+    """
+    with METRICS.timer('parser_fetch_seconds', source='stream'):
+        try:
+            return list(parse_stream(HTTP_CLIENT.stream(url)))
+        except requests.RequestException:
+            METRICS.inc('parser_fetch_errors')
+            raise
+
+
+def _fetch_rows_tree(url: str) -> list:
+    return parse_page(load_page(fetch_page(url)))
+
+
+def find_page_count(page: lxml.html.HtmlElement) -> int:
+    """
+    Поиск количества страниц по пагинатору
+    :param page: корень HTML-документа lxml
+    :return: номер последней страницы
+    """
+    paginator = XPATH_PAGINATOR(page)
+    if not paginator:
+        return 1
+    indexes = [int(i.text_content().strip()) for i in XPATH_PAGE_INDEX(paginator[0])
+               if i.text_content().strip().isdigit()]
+    return max(indexes, default=1)
+
+
+def load_page(html: bytes) -> lxml.html.HtmlElement:
+    """
+    Построение дерева страницы с замером времени
+    :param html: тело страницы
+    :return: корень HTML-документа lxml
+    """
+    with METRICS.timer('parser_parse_seconds', stage='tree'):
+        return lxml.html.fromstring(html)
+
+
+def parse_html(html: bytes) -> list:
+    """
+    Разбор страницы из тела ответа. Функция не зависит от состояния процесса и может выполняться в пуле процессов
+    :param html: тело страницы
+    :return: список кортежей с полями Problem
+    """
+    return [tuple(problem) for problem in parse_page(load_page(html))]
+
+
+def parse_page(page: lxml.html.HtmlElement) -> list:
+    """
+    Парсинг таблицы на странице сайта. Строки с заголовками (th) пропускаются
+    :param page: корень HTML-документа lxml
+    :return: список объектов Problem для записи в БД
+    """
+    with METRICS.timer('parser_parse_seconds', stage='rows'):
+        return [parse_row(row) for row in page.iter('tr') if row.find('.//th') is None]
+
+
+def parse_stream(chunks):
+    """
+    Потоковый разбор таблицы: части страницы подаются HTML-парсеру lxml, каждая строка разбирается parse_row,
+    как только парсер её закрыл, и сразу удаляется из дерева вместе с предыдущими строками.
+    В памяти держится только текущая строка и разметка вне таблицы
+    :param chunks: итератор частей тела страницы
+    :return: генератор объектов Problem, как у parse_page
+    """
+    parser = lxml.etree.HTMLPullParser(events=('end',), tag='tr')
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from _read_rows(parser)
+    parser.close()
+    yield from _read_rows(parser)
+
+
+def _read_rows(parser: lxml.etree.HTMLPullParser):
+    for _, row in parser.read_events():
+        if row.find('.//th') is None:
+            yield parse_row(row)
+        row.clear(keep_tail=True)
+        parent = row.getparent()
+        while parent is not None and row.getprevious() is not None:
+            del parent[0]
+
+
+def parse_row(row: lxml.html.HtmlElement) -> ConnectDB.Problem:
+    """
+    Разбор строки таблицы за один проход по её элементам.
+    Для каждого поля берётся первый подходящий элемент в порядке документа, как у find из BeautifulSoup
+    :param row: строка таблицы
+    :return: объект Problem, при отсутствии имени или номера задачи поле name равно None.
+    Текст ссылок на категории сохраняется в notice_titles: это название категории на языке страницы
+    """
+    number = name = rank = count_solve = link = None
+    notice = []
+    titles = {}
+    has_link = False
+    for element in row.iter('td', 'div', 'span', 'a'):
+        tag = element.tag
+        classes = element.get('class', '').split()
+        if tag == 'td':
+            if number is None and 'id' in classes:
+                number = element.text_content().strip()
+        elif tag == 'div':
+            if name is None and element.get('style') == 'float: left;':
+                name = element.text_content().strip()
+        elif tag == 'span':
+            if rank is None and 'ProblemRating' in classes:
+                rank = _to_int(element.text_content().strip(), 'rank')
+        else:
+            if not has_link:
+                has_link = True
+                link = element.get('href')
+            if 'notice' in classes:
+                key = tag_key(element)
+                notice.append(key)
+                titles[key] = element.text_content().strip()
+            if count_solve is None and element.get('title') == 'Participants solved the problem':
+                count_solve = _to_int(element.text_content().strip()[1:], 'count_solve')
+
+    if name is None or number is None:
+        logging.error(f'parse_row: name={name!r}, number={number!r}')
+        full_name = None
+    else:
+        full_name = name + ' - ' + number
+    contest_id, problem_index = ConnectDB.split_problem_number(number)
+    return ConnectDB.Problem(full_name, rank, count_solve, notice, link, contest_id, problem_index, titles)
+
+
+def tag_key(element: lxml.html.HtmlElement) -> str:
+    """
+    Ключ категории из ссылки вида /problemset?tags=binary+search. Он не зависит от языка страницы
+    и совпадает с именем категории в API, поэтому оба источника дают одинаковые категории.
+    Если в ссылке нет параметра tags, берётся текст ссылки
+    :param element: ссылка на категорию
+    :return: ключ категории, например "binary search"
+    """
+    tags = parse_qs(urlparse(element.get('href', '')).query).get('tags')
+    return tags[0].strip() if tags else element.text_content().strip()
 
 
-def parse_link(string: bs4.BeautifulSoup) -> str:
+def _to_int(text: str, field: str):
     """
-    Поиск ссылки на задачу
-    :param string: строка таблицы
-    :return: количество решений в int
+    Вспомогательная функция для преобразования текста ячейки в число
+    :param text: текст ячейки
+    :param field: имя поля для записи в лог
+    :return: число или None, если текст не является числом
     """
     try:
-        link = string.find('a').get('href')
-    except AttributeError as e:
-        logging.error(f'parse_count_solve {e}')
-        link = None
-    return link
+        return int(text)
+    except ValueError as e:
+        logging.error(f'parse_row::{field}: {e}')
+        return None
 
 
 if __name__ == '__main__':
@@ -0,0 +1,68 @@
+import re
+
+import lxml.etree
+import lxml.html
+
+import ConnectDB  # Созданный модуль
+
+
+NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+DIVISION = re.compile(r'Div\.\s*(\d)(?:\s*\+\s*Div\.\s*(\d))?', re.IGNORECASE)
+
+XPATH_STATEMENT = lxml.etree.XPath("//div[contains(concat(' ', normalize-space(@class), ' '), ' problem-statement ')]")
+XPATH_TIME_LIMIT = lxml.etree.XPath(".//div[contains(concat(' ', normalize-space(@class), ' '), ' time-limit ')]")
+XPATH_MEMORY_LIMIT = lxml.etree.XPath(".//div[contains(concat(' ', normalize-space(@class), ' '), ' memory-limit ')]")
+XPATH_LEGEND = lxml.etree.XPath("./div[not(@class)]")
+XPATH_CONTEST_NAME = lxml.etree.XPath("//table[contains(concat(' ', normalize-space(@class), ' '), ' rtable ')]"
+                                      "//th//a[contains(@href, '/contest/')]")
+
+
+def parse_details(html: bytes) -> ConnectDB.Details:
+    """
+    Разбор страницы задачи: ограничения времени и памяти, длина условия, название и дивизион раунда.
+    Поля, которых нет на странице, равны None
+    :param html: тело страницы задачи
+    :return: объект Details
+    """
+    page = lxml.html.fromstring(html)
+    statement = XPATH_STATEMENT(page)
+    time_limit = memory_limit = statement_length = None
+    if statement:
+        time_limit = _property_number(XPATH_TIME_LIMIT(statement[0]), float)
+        memory_limit = _property_number(XPATH_MEMORY_LIMIT(statement[0]), int)
+        legend = XPATH_LEGEND(statement[0])
+        if legend:
+            statement_length = len(' '.join(legend[0].text_content().split()))
+    contest = XPATH_CONTEST_NAME(page)
+    contest_name = ' '.join(contest[0].text_content().split()) if contest else None
+    return ConnectDB.Details(time_limit, memory_limit, statement_length, contest_name, find_division(contest_name))
+
+
+def find_division(contest_name: str):
+    """
+    Определение дивизиона по названию раунда
+    :param contest_name: название раунда, например "Codeforces Round 900 (Div. 1 + Div. 2)"
+    :return: "1", "2", "1+2" и т. п. или None для раундов без дивизиона
+    """
+    match = DIVISION.search(contest_name or '')
+    if not match:
+        return None
+    return '+'.join(d for d in match.groups() if d)
+
+
+def _property_number(elements: list, cast):
+    """
+    Вспомогательная функция для чтения числа из блока ограничения, например "1 second" или "256 мегабайт".
+    Подпись блока (property-title) пропускается
+    :param elements: найденные блоки ограничения
+    :param cast: тип числа
+    :return: число или None
+    """
+    if not elements:
+        return None
+    block = elements[0]
+    text = ''.join(block.xpath('./text()')) or block.text_content()
+    match = NUMBER.search(text)
+    if not match:
+        return None
+    return cast(float(match.group().replace(',', '.')))
@@ -0,0 +1,68 @@
+import os
+import time
+from collections import OrderedDict
+
+import Catalog  # Созданный модуль
+import Metrics  # Созданный модуль
+
+
+SEARCH_CACHE_SIZE = int(os.getenv('BOT_SEARCH_CACHE_SIZE', 1024))  # Максимальное количество запросов в кеше
+SEARCH_CACHE_TTL = float(os.getenv('BOT_SEARCH_CACHE_TTL', 300))  # Время жизни результата, с
+
+
+class ResultCache:
+    """
+    Кеш результатов запросов бота с вытеснением давно не использованных записей и временем жизни.
+    Кеш очищается целиком при смене версии каталога, то есть после обхода, изменившего задачи.
+    На нём же построен кеш клавиатур Keyboards.KeyboardCache
+    """
+    def __init__(self, catalog: Catalog.Catalog, name: str, size: int = SEARCH_CACHE_SIZE,
+                 ttl: float = SEARCH_CACHE_TTL):
+        """
+        :param catalog: каталог, по версии которого определяется устаревание результатов
+        :param name: имя кеша для метрик
+        :param size: максимальное количество записей
+        :param ttl: время жизни записи в секундах, float('inf') - до смены версии каталога
+        """
+        self.__catalog = catalog
+        self.__name = name
+        self.__size = size
+        self.__ttl = ttl
+        self.__version = None
+        self.__items = OrderedDict()  # {ключ: (момент устаревания по time.monotonic, результат)}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: tuple, load):
+        """
+        Результат из кеша или загруженный функцией load при промахе
+        :param key: нормализованные параметры запроса
+        :param load: функция без аргументов, возвращающая корутину с результатом
+        :return: результат запроса
+        """
+        version = self.__catalog.version
+        if version != self.__version:
+            self.__items.clear()
+            self.__version = version
+        item = self.__items.get(key)
+        if item is not None and item[0] > time.monotonic():
+            self.__items.move_to_end(key)
+            self._count('hit')
+            return item[1]
+
+        self._count('miss')
+        result = await load()
+        if version == self.__version:  # Каталог не сменился, пока выполнялся запрос
+            self.__items[key] = (time.monotonic() + self.__ttl, result)
+            self.__items.move_to_end(key)
+            if len(self.__items) > self.__size:
+                self.__items.popitem(last=False)
+        Metrics.REGISTRY.set('bot_cache_size', len(self.__items), cache=self.__name)
+        return result
+
+    def _count(self, result: str) -> None:
+        if result == 'hit':
+            self.hits += 1
+        else:
+            self.misses += 1
+        Metrics.REGISTRY.inc('bot_cache_requests', cache=self.__name, result=result)
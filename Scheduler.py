@@ -0,0 +1,101 @@
+import logging
+import math
+import random
+import time
+from contextlib import nullcontext
+
+import Metrics  # Созданный модуль
+
+
+class Job:
+    """
+    Периодическая задача планировщика
+    """
+    def __init__(self, name: str, func, interval: float, jitter: float, first_run: float):
+        """
+        :param name: имя задачи для лога и метрик
+        :param func: функция без аргументов
+        :param interval: период запуска в секундах
+        :param jitter: максимальная случайная задержка запуска в секундах
+        :param first_run: время первого запуска по time.monotonic
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.due = first_run  # Время запуска по расписанию, без случайной задержки
+        self.run_at = first_run + random.uniform(0, jitter)
+
+    def reschedule(self, now: float) -> None:
+        """
+        Перенос задачи на следующий период. Расписание строится от прошлого времени запуска, а не от конца
+        выполнения, поэтому долгий запуск не сдвигает последующие; пропущенные за время выполнения периоды
+        не наверстываются
+        :param now: текущее время по time.monotonic
+        :return: None
+        """
+        self.due += self.interval * max(1, math.ceil((now - self.due) / self.interval))
+        self.run_at = self.due + random.uniform(0, self.jitter)
+
+
+class Scheduler:
+    """
+    Запуск задач с фиксированным периодом и случайной задержкой.
+    Задачи выполняются по одной; перед запуском берётся блокировка guard, и если она занята
+    (например, другим экземпляром парсера), запуск пропускается до следующего периода.
+    Ошибка задачи записывается в лог и не останавливает планировщик
+    """
+    def __init__(self, guard=None):
+        """
+        :param guard: функция, возвращающая контекстный менеджер, который отдаёт True, если блокировка взята
+        """
+        self.__guard = guard or (lambda: nullcontext(True))
+        self.__jobs = []
+        self.__metrics = Metrics.REGISTRY
+
+    def add(self, name: str, func, interval: float, jitter: float = 0.0, delay: float = 0.0) -> None:
+        """
+        Добавление задачи
+        :param name: имя задачи для лога и метрик
+        :param func: функция без аргументов
+        :param interval: период запуска в секундах
+        :param jitter: максимальная случайная задержка запуска в секундах
+        :param delay: задержка первого запуска в секундах
+        :return: None
+        """
+        self.__jobs.append(Job(name, func, interval, jitter, time.monotonic() + delay))
+
+    def run_forever(self) -> None:
+        """
+        Бесконечный цикл запуска задач, прерывается KeyboardInterrupt
+        :return: None
+        """
+        while True:
+            job = min(self.__jobs, key=lambda j: j.run_at)
+            wait = job.run_at - time.monotonic()
+            if wait > 0:
+                logging.info(f'Scheduler::Next run of {job.name} in {wait / 60:.1f} min')
+                time.sleep(wait)
+            self.run_job(job)
+
+    def run_job(self, job: Job) -> None:
+        """
+        Запуск задачи под блокировкой и перенос её на следующий период
+        :param job: задача
+        :return: None
+        """
+        started = time.monotonic()
+        try:
+            with self.__guard() as acquired:
+                if not acquired:
+                    logging.info(f'Scheduler::{job.name} skipped: the lock is held by another crawler')
+                    result = 'locked'
+                else:
+                    with self.__metrics.timer('scheduler_job_seconds', job=job.name):
+                        job.func()
+                    result = 'ok'
+        except Exception as e:
+            logging.exception(f'Scheduler::{job.name} failed: {e}')
+            result = 'error'
+        self.__metrics.inc('scheduler_runs', job=job.name, result=result)
+        job.reschedule(max(started, time.monotonic()))
@@ -0,0 +1,219 @@
+import argparse
+import io
+import itertools
+import json
+import logging
+import lzma
+import struct
+import time
+from array import array
+
+import ConnectDB  # Созданный модуль
+import Contests  # Созданный модуль
+
+
+MAGIC = b'CFSNAP1\n'
+# Таблицы в порядке загрузки (сначала те, на которые ссылаются другие) и ключи для упорядочивания строк
+TABLES = (
+    ('codeforces', 'id_codeforces'),
+    ('notice', 'id_notice'),
+    ('notice_query', 'id_notice_query'),
+)
+INT_TYPES = {20, 21, 23}  # OID типов bigint, smallint, integer
+FLOAT_TYPES = {700, 701}  # OID типов real, double precision
+
+
+def export_snapshot(db: ConnectDB.ConDB, path: str) -> dict:
+    """
+    Выгрузка таблиц codeforces, notice и notice_query в сжатый файл с хранением по столбцам.
+    Целые столбцы хранятся разностями соседних значений, вещественные - упакованными массивами,
+    строковые - списками JSON; весь файл сжимается lzma
+    :param db: Объект работающий с PostgreSQL
+    :param path: путь к файлу снимка
+    :return: заголовок снимка с количеством строк по таблицам
+    """
+    header = {'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'tables': []}
+    blocks = []
+    with db.transaction() as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY;")  # Согласованный снимок таблиц
+        for table, key in TABLES:
+            cur.execute(f"SELECT * FROM {table} ORDER BY {key};")
+            rows = cur.fetchall()
+            columns = []
+            for index, column in enumerate(cur.description):
+                kind = 'int' if column.type_code in INT_TYPES else 'float' if column.type_code in FLOAT_TYPES else 'json'
+                columns.append({'name': column.name, 'kind': kind})
+                blocks.append(_encode_column(kind, [row[index] for row in rows]))
+            header['tables'].append({'name': table, 'columns': columns, 'rows': len(rows)})
+
+    with lzma.open(path, 'wb') as f:
+        f.write(MAGIC)
+        for block in (json.dumps(header).encode(), *blocks):
+            f.write(struct.pack('<I', len(block)))
+            f.write(block)
+    logging.info(f"Snapshot::Exported {[(t['name'], t['rows']) for t in header['tables']]} to {path}")
+    return header
+
+
+def read_snapshot(path: str) -> tuple:
+    """
+    Чтение файла снимка
+    :param path: путь к файлу снимка
+    :return: кортеж (заголовок, {таблица: {столбец: список значений}})
+    """
+    with lzma.open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a problem snapshot')
+        header = json.loads(_read_block(f))
+        tables = {}
+        for table in header['tables']:
+            tables[table['name']] = {
+                column['name']: _decode_column(column['kind'], _read_block(f), table['rows'])
+                for column in table['columns']
+            }
+    return header, tables
+
+
+def import_snapshot(db: ConnectDB.ConDB, path: str, replace: bool = False) -> dict:
+    """
+    Загрузка снимка в БД командой COPY. После загрузки задачи распределяются по контестам,
+    обновляются представления для бота и версия каталога
+    :param db: Объект работающий с PostgreSQL
+    :param path: путь к файлу снимка
+    :param replace: очистить таблицы перед загрузкой; иначе загрузка выполняется только в пустую БД.
+    Очистка затрагивает и зависящие от задач таблицы: контесты и историю количества решений
+    :return: заголовок снимка
+    """
+    header, tables = read_snapshot(path)
+    with db.transaction() as cur:
+        if replace:
+            cur.execute("TRUNCATE codeforces, notice, notice_query RESTART IDENTITY CASCADE;")
+        else:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM codeforces) OR EXISTS (SELECT 1 FROM notice);")
+            if cur.fetchone()[0]:
+                raise ValueError('The database is not empty, use replace to overwrite it')
+        for table, key in TABLES:
+            columns = tables[table]
+            cur.copy_expert(f"COPY {table}({', '.join(columns)}) FROM STDIN", _copy_text(columns))
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', '{key}'), "
+                        f"COALESCE((SELECT MAX({key}) FROM {table}), 0) + 1, false);")
+        cur.execute("""
+        INSERT INTO solve_history(id_codeforces, crawl_ts, count_solve, rank)
+        SELECT id_codeforces, now(), count_solve, rank FROM codeforces;
+        """)
+    Contests.assign_contests(db)
+    ConnectDB.refresh_read_model(db)
+    ConnectDB.bump_catalog_version(db)
+    logging.info(f"Snapshot::Imported {[(t['name'], t['rows']) for t in header['tables']]} from {path}")
+    return header
+
+
+def load_problems(path: str) -> list:
+    """
+    Задачи снимка в виде объектов Problem, например как воспроизводимый набор данных для замеров записи в БД
+    :param path: путь к файлу снимка
+    :return: список объектов Problem
+    """
+    _, tables = read_snapshot(path)
+    notices = dict(zip(tables['notice']['id_notice'], tables['notice']['notice_name']))
+    tags = {}
+    for id_codeforces, id_notice in zip(tables['notice_query']['id_codeforces'], tables['notice_query']['id_notice']):
+        tags.setdefault(id_codeforces, []).append(notices[id_notice])
+    codeforces = tables['codeforces']
+    return [
+        ConnectDB.Problem(name, rank, count_solve, tags.get(id_codeforces, []), link, contest_id, problem_index)
+        for id_codeforces, name, rank, count_solve, link, contest_id, problem_index in zip(
+            codeforces['id_codeforces'], codeforces['name'], codeforces['rank'], codeforces['count_solve'],
+            codeforces['link'], codeforces['contest_id'], codeforces['problem_index'],
+        )
+    ]
+
+
+def _encode_column(kind: str, values: list) -> bytes:
+    """
+    Упаковка столбца: для чисел - битовая маска NULL и массив значений, для остальных - список JSON
+    :param kind: int, float или json
+    :param values: значения столбца
+    :return: байты блока
+    """
+    if kind == 'json':
+        return json.dumps(values, ensure_ascii=False, default=str).encode()
+    mask = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value is None:
+            mask[i // 8] |= 1 << i % 8
+    if kind == 'int':
+        numbers = [0 if value is None else value for value in values]
+        packed = array('q', (b - a for a, b in zip([0, *numbers], numbers)))  # Разности сжимаются лучше значений
+    else:
+        packed = array('d', (0.0 if value is None else value for value in values))
+    return bytes(mask) + packed.tobytes()
+
+
+def _decode_column(kind: str, block: bytes, rows: int) -> list:
+    """
+    Распаковка столбца, упакованного _encode_column
+    :param kind: int, float или json
+    :param block: байты блока
+    :param rows: количество строк
+    :return: значения столбца
+    """
+    if kind == 'json':
+        return json.loads(block)
+    mask_size = (rows + 7) // 8
+    mask, packed = block[:mask_size], array('q' if kind == 'int' else 'd')
+    packed.frombytes(block[mask_size:])
+    values = list(itertools.accumulate(packed)) if kind == 'int' else list(packed)
+    return [None if mask[i // 8] >> i % 8 & 1 else value for i, value in enumerate(values)]
+
+
+def _read_block(f) -> bytes:
+    size, = struct.unpack('<I', f.read(4))
+    return f.read(size)
+
+
+def _copy_text(columns: dict) -> io.StringIO:
+    """
+    Формирование данных для COPY в текстовом формате PostgreSQL
+    :param columns: {столбец: список значений}
+    :return: поток строк COPY
+    """
+    buffer = io.StringIO()
+    for row in zip(*columns.values()):
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export or import a snapshot of the problem tables')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='dump codeforces, notice and notice_query into a file')
+    export_parser.add_argument('path')
+    import_parser = commands.add_parser('import', help='bulk-load a snapshot into the database')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--replace', action='store_true', help='truncate the tables before loading')
+    args = parser.parse_args()
+
+    database = ConnectDB.ConDB()
+    start = time.perf_counter()
+    if args.command == 'export':
+        header = export_snapshot(database, args.path)
+    else:
+        header = import_snapshot(database, args.path, replace=args.replace)
+    rows = ', '.join(f"{t['name']}={t['rows']}" for t in header['tables'])
+    print(f'{args.command.capitalize()}ed {rows} in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
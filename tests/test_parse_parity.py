@@ -0,0 +1,78 @@
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import ParserCodeforces
+from conftest import read_fixture
+
+bs4 = pytest.importorskip('bs4')
+
+PAGES = ('problemset.html', 'edge_rows.html')
+
+
+def reference_rows(html: bytes) -> list:
+    """
+    Разбор строк таблицы поиском каждого поля через BeautifulSoup, как до перехода на lxml.
+    Категории сравниваются по ключу из ссылки, текст ссылки - если ключа нет
+    :param html: тело страницы
+    :return: список кортежей (имя, сложность, количество решений, категории, ссылка)
+    """
+    rows = []
+    for row in bs4.BeautifulSoup(html, 'lxml').find_all('tr'):
+        if row.find('th'):
+            continue
+        name = row.find('div', style='float: left;').text.strip() + ' - ' + row.find('td', class_='id').text.strip()
+        rank = row.find('span', class_='ProblemRating')
+        count_solve = row.find('a', title='Participants solved the problem')
+        notice = [parse_qs(urlparse(a.get('href')).query).get('tags', [a.text.strip()])[0]
+                  for a in row.find_all('a', class_='notice')]
+        rows.append((name, _reference_int(rank.text.strip()) if rank else None,
+                     _reference_int(count_solve.text.strip()[1:]) if count_solve else None,
+                     notice, row.find('a').get('href')))
+    return rows
+
+
+def _reference_int(text: str):
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+def reference_page_count(html: bytes) -> int:
+    paginator = bs4.BeautifulSoup(html, 'lxml').find('div', class_='pagination')
+    if not paginator:
+        return 1
+    return max((int(i.text.strip()) for i in paginator.find_all('span', class_='page-index')
+                if i.text.strip().isdigit()), default=1)
+
+
+@pytest.mark.parametrize('name', PAGES)
+def test_parse_row_matches_reference(name):
+    html = read_fixture(name)
+    problems = ParserCodeforces.parse_page(ParserCodeforces.load_page(html))
+    assert [(p.name, p.rank, p.count_solve, p.notice_lst, p.link) for p in problems] == reference_rows(html)
+
+
+@pytest.mark.parametrize('name', PAGES)
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 4096])
+def test_parse_stream_matches_tree(name, chunk_size):
+    html = read_fixture(name)
+    chunks = (html[i:i + chunk_size] for i in range(0, len(html), chunk_size))
+    assert list(ParserCodeforces.parse_stream(chunks)) == ParserCodeforces.parse_page(ParserCodeforces.load_page(html))
+
+
+@pytest.mark.parametrize('name', PAGES)
+def test_find_page_count_matches_reference(name):
+    html = read_fixture(name)
+    assert ParserCodeforces.find_page_count(ParserCodeforces.load_page(html)) == reference_page_count(html)
+
+
+def test_edge_rows():
+    problems = ParserCodeforces.parse_page(ParserCodeforces.load_page(read_fixture('edge_rows.html')))
+    assert [(p.contest_id, p.problem_index, p.rank, p.count_solve, p.notice_lst) for p in problems] == [
+        (4, 'A', 800, 123456, ['brute force', 'math']),
+        (1, 'B', None, None, []),
+        (1900, 'E', None, 7, ['2-sat']),
+        (1000, 'A1', None, None, []),
+    ]
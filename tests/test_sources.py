@@ -0,0 +1,95 @@
+import pytest
+
+import CodeforcesApi
+import ConnectDB
+import HttpClient
+import ParserCodeforces
+from conftest import read_fixture
+
+
+@pytest.fixture
+def client():
+    return HttpClient.HttpClient(cache_dir=None, interval=0)
+
+
+@pytest.fixture
+def api_problems(fixture_server, client):
+    url, routes = fixture_server
+    routes['/api/problemset.problems?lang=ru'] = read_fixture('problemset.problems.json')
+    return list(CodeforcesApi.fetch_problems(client, f'{url}/api/problemset.problems?lang=ru'))
+
+
+@pytest.fixture
+def html_problems(fixture_server, client):
+    url, routes = fixture_server
+    routes['/problemset?locale=ru'] = read_fixture('problemset.html')
+    return ParserCodeforces.parse_page(ParserCodeforces.load_page(client.get(f'{url}/problemset?locale=ru')))
+
+
+def test_api_problems(api_problems):
+    # Задачи без номера контеста (acmsguru) пропускаются
+    assert api_problems == [
+        ConnectDB.Problem('Тимофей и чёрно-белое дерево (сложная версия) - 1790F2', 2100, 4321,
+                          ['binary search', 'data structures', 'dfs and similar'],
+                          '/problemset/problem/1790/F2', 1790, 'F2'),
+        ConnectDB.Problem('Арбуз - 4A', 800, 123456, ['brute force', 'math', '*special'],
+                          '/problemset/problem/4/A', 4, 'A'),
+    ]
+
+
+def test_api_error(fixture_server, client):
+    url, routes = fixture_server
+    routes['/api/problemset.problems'] = b'{"status":"FAILED","comment":"Call limit exceeded"}'
+    with pytest.raises(CodeforcesApi.ApiError, match='Call limit exceeded'):
+        CodeforcesApi.fetch_problems(client, f'{url}/api/problemset.problems')
+
+
+def test_api_invalid_json(fixture_server, client):
+    url, routes = fixture_server
+    routes['/api/problemset.problems'] = b'<html>Codeforces is temporarily unavailable</html>'
+    with pytest.raises(CodeforcesApi.ApiError, match='invalid JSON'):
+        CodeforcesApi.fetch_problems(client, f'{url}/api/problemset.problems')
+
+
+def test_html_tags_are_slugs(html_problems):
+    # Категории берутся из параметра tags ссылки, а не из локализованного текста
+    assert [p.notice_lst for p in html_problems] == [
+        ['binary search', 'data structures', 'dfs and similar'],
+        ['brute force', 'math', '*special'],
+    ]
+
+
+def test_html_tag_titles(html_problems):
+    # Текст ссылки сохраняется как название категории для меню и поиска бота
+    assert [p.notice_titles for p in html_problems] == [
+        {'binary search': 'бинпоиск', 'data structures': 'структуры данных',
+         'dfs and similar': 'поиск в глубину и подобное'},
+        {'brute force': 'перебор', 'math': 'математика', '*special': '*особая задача'},
+    ]
+
+
+def test_sources_agree(api_problems, html_problems):
+    # Переключение источника не меняет ни задачи, ни их отпечатки; названия категорий есть только у HTML
+    assert [p._replace(notice_titles=None) for p in html_problems] == api_problems
+    assert ([ConnectDB.problem_fingerprint(p) for p in html_problems]
+            == [ConnectDB.problem_fingerprint(p) for p in api_problems])
+
+
+def test_stream_matches_tree(fixture_server, client, html_problems):
+    url, routes = fixture_server
+    routes['/problemset?locale=ru'] = read_fixture('problemset.html')
+    assert list(ParserCodeforces.parse_stream(client.stream(f'{url}/problemset?locale=ru', 64))) == html_problems
+
+
+@pytest.mark.parametrize('body', [
+    b'{"status":"OK","result":{"problems":[],"problemStatistics":null}}',
+    b'{"status":"OK","result":{"problems":[{"contestId":4,"index":"A","name":"A"}],"problemStatistics":[1]}}',
+    b'{"status":"OK","result":{"problems":[null],"problemStatistics":[]}}',
+    b'{"status":"OK","result":[]}',
+])
+def test_api_unexpected_payload(fixture_server, client, body):
+    # Ошибка формата - RequestException, поэтому parse_full переходит к HTML-страницам
+    url, routes = fixture_server
+    routes['/api/problemset.problems'] = body
+    with pytest.raises(CodeforcesApi.ApiError, match='unexpected payload'):
+        CodeforcesApi.fetch_problems(client, f'{url}/api/problemset.problems')